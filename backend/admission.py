@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Request Coalescing & Admission Control ---
+# For endpoints that get stampeded: when an alert fires, every client asks
+# for a path at once, mostly from the same few start nodes.
+#   * SingleFlight: concurrent calls with the same key await one shared
+#     computation instead of each starting their own.
+#   * AdmissionGate: at most `max_in_flight` computations run (on a
+#     dedicated, equally sized thread pool), at most `max_queue` wait for a
+#     slot, and a waiter gives up after `queue_timeout`. Anything beyond that
+#     is rejected immediately with Overloaded.
+#   * StaleCache: the last good answer per query, to serve instead of an
+#     error when the gate rejects.
+# Waiting happens on the event loop, so queued and coalesced requests hold
+# no threads. All methods are called from the event loop; no locking needed.
+
+
+class Overloaded(Exception):
+    pass
+
+
+class SingleFlight:
+    def __init__(self):
+        self.in_flight = {}  # key -> asyncio.Future
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key, fn):
+        """
+        Awaits fn() once per key at a time. Returns (result, shared), where
+        shared is True if the result came from another caller's call.
+        Exceptions from fn() are raised in every caller.
+        """
+        task = self.in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            # Its own task, so a caller that goes away doesn't cancel it for the others
+            task = asyncio.ensure_future(fn())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self.in_flight.pop(key, None)
+                                   if self.in_flight.get(key) is done else None)
+        return await asyncio.shield(task), shared
+
+
+class AdmissionGate:
+    def __init__(self, max_in_flight=8, max_queue=64, queue_timeout=2.0, name="admission"):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=name)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.running = 0
+        self.waiting = 0
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on the gate's thread pool, or raises Overloaded."""
+        if self.semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise Overloaded("queue full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise Overloaded("timed out waiting for a slot") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+
+class StaleCache:
+    """Last good value per key, bounded LRU."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.items = OrderedDict()  # key -> (stored_at, value)
+
+    def put(self, key, value):
+        self.items[key] = (time.time(), value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def get(self, key):
+        """(stored_at, value), or None."""
+        return self.items.get(key)
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import CACHE_REQUESTS
+
+# --- Multi-Zone Alert Broadcaster ---
+# When the scanner publishes a new world state, every zone gets its own
+# route and announcement. An announcement is a sequence of segments, and
+# segments are what get synthesized and cached, so zones share whatever
+# they actually have in common:
+#   * the danger header, shared by every zone in a cycle,
+#   * the route from the first node where the zone's path joins another
+#     zone's path onward (paths to the same exit mostly merge into a few
+#     trunks), so only the short lead-in up to that node is per zone,
+#   * the closing instructions, which never change.
+# Distinct segments are synthesized concurrently under a rate limit so the
+# whole site is covered within one scan cycle. A zone's clip is its
+# segments' MP3s concatenated.
+#
+# Only the scanner process runs the job. With a clip_dir, clips and the
+# published manifest are also written there, so API worker processes
+# that don't run the job can serve them.
+
+
+class TokenBucket:
+    """Simple thread-safe rate limiter (tokens per second, with burst)."""
+
+    def __init__(self, rate_per_sec, burst=None):
+        self.rate = float(rate_per_sec)
+        self.capacity = float(burst if burst is not None else max(1.0, rate_per_sec))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def clip_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def shared_suffixes(paths):
+    """
+    {zone: index of the first node from which its path continues exactly
+    like some other zone's path} for zones whose path shares at least its
+    last two nodes with another zone. Suffixes are interned back to front,
+    so this is linear in the total path length.
+    """
+    interned = {}  # (node, id of the rest of the path) -> suffix id
+    suffix_ids = {}
+    users = {}  # suffix id -> number of zones whose path ends with it
+    for zone, path in paths.items():
+        ids, rest = [], None
+        for node in reversed(path or []):
+            rest = interned.setdefault((node, rest), len(interned))
+            ids.append(rest)
+        ids.reverse()
+        suffix_ids[zone] = ids
+        for suffix in set(ids[:-1]):  # a lone exit isn't a route
+            users[suffix] = users.get(suffix, 0) + 1
+
+    shared_from = {}
+    for zone, ids in suffix_ids.items():
+        for i, suffix in enumerate(ids[:-1]):
+            if users[suffix] > 1:
+                shared_from[zone] = i
+                break
+    return shared_from
+
+
+class AlertBroadcaster:
+    """
+    Background job that turns a world state into ready-to-play alert
+    clips for every zone.
+
+    route_fn(zone, danger_nodes, crowd_data) -> escape path (list) or None
+    message_fn(danger_nodes, escape_path, shared_from) -> announcement
+        segment texts; shared_from is the index in escape_path from which
+        the rest of the path is shared with another zone, or None
+    synthesize_fn(text) -> audio bytes
+    on_routes({zone: escape path}) is called after each routing pass
+    """
+
+    def __init__(self, zones, route_fn, message_fn, synthesize_fn,
+                 max_concurrent=4, rate_per_sec=5.0, max_cached_clips=256, clip_dir=None, on_routes=None):
+        self.zones = list(zones)
+        self.route_fn = route_fn
+        self.message_fn = message_fn
+        self.synthesize_fn = synthesize_fn
+        self.rate_limiter = TokenBucket(rate_per_sec)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="alert-tts")
+        self.max_cached_clips = max_cached_clips
+        self.clip_dir = clip_dir
+        self.on_routes = on_routes
+        self.is_producer = False
+        self.manifest_cache = (None, None)  # (mtime_ns, published dict)
+        if clip_dir:
+            os.makedirs(clip_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.pending_state = None
+        self.running = False
+
+        # Clip cache is keyed by segment text hash, so an unchanged segment
+        # is never re-synthesized across cycles.
+        self.clips = OrderedDict()  # segment clip_id -> audio bytes
+        self.published = {"version": 0, "generated_at": None, "zones": {}}
+
+        self.worker = threading.Thread(target=self._run, daemon=True, name="alert-broadcaster")
+
+    def start(self):
+        self.is_producer = True
+        self.worker.start()
+
+    def submit(self, danger_nodes, crowd_data):
+        """Schedules a broadcast for this world state. Latest state wins."""
+        with self.lock:
+            self.pending_state = (list(danger_nodes), list(crowd_data))
+            self.wakeup.notify()
+
+    def get_published(self):
+        if not self.is_producer and self.clip_dir:
+            published = self._read_manifest()
+            return dict(published, pending=False)
+        with self.lock:
+            return {
+                "version": self.published["version"],
+                "generated_at": self.published["generated_at"],
+                "pending": self.pending_state is not None or self.running,
+                "zones": dict(self.published["zones"]),
+            }
+
+    def get_clip(self, zone_id):
+        """Returns (clip_info, audio bytes) for a zone, or (None, None)."""
+        if not self.is_producer and self.clip_dir:
+            info = self._read_manifest()["zones"].get(zone_id)
+            if info is None:
+                return None, None
+            try:
+                parts = []
+                for segment in info["segments"]:
+                    with open(self._clip_path(segment), "rb") as f:
+                        parts.append(f.read())
+                return info, b"".join(parts)
+            except FileNotFoundError:
+                return info, None
+        with self.lock:
+            info = self.published["zones"].get(zone_id)
+            if info is None:
+                return None, None
+            parts = [self.clips.get(segment) for segment in info["segments"]]
+            return info, (None if None in parts else b"".join(parts))
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.pending_state is None:
+                    self.wakeup.wait()
+                danger_nodes, crowd_data = self.pending_state
+                self.pending_state = None
+                self.running = True
+            try:
+                self._broadcast(danger_nodes, crowd_data)
+            except Exception as e:
+                print(f"--- BROADCAST: ERROR generating zone alerts: {e} ---")
+            finally:
+                with self.lock:
+                    self.running = False
+
+    def _broadcast(self, danger_nodes, crowd_data):
+        started = time.time()
+
+        # 1. Route every zone and split its announcement into segments.
+        # An all-clear state publishes no clips at all.
+        paths = {zone: self.route_fn(zone, danger_nodes, crowd_data) for zone in (self.zones if danger_nodes else [])}
+        if self.on_routes:
+            self.on_routes(paths)
+        shared_from = shared_suffixes(paths)
+        messages = {}  # segment clip_id -> text
+        zone_clips = {}  # zone -> clip info
+        for zone, path in paths.items():
+            segments = []
+            for text in self.message_fn(danger_nodes, path or [], shared_from.get(zone)):
+                segment_id = clip_hash(text)
+                messages[segment_id] = text
+                segments.append(segment_id)
+            zone_clips[zone] = {
+                "clip_id": clip_hash("/".join(segments)),
+                "segments": segments,
+                "message": " ".join(messages[segment] for segment in segments),
+                "path": path,
+            }
+
+        # 2. Synthesize only the distinct messages we don't already have
+        with self.lock:
+            missing = [cid for cid in messages if cid not in self.clips]
+        CACHE_REQUESTS.inc(len(messages) - len(missing), cache="alert_clips", result="hit")
+        CACHE_REQUESTS.inc(len(missing), cache="alert_clips", result="miss")
+
+        def synthesize(clip_id):
+            self.rate_limiter.acquire()
+            return clip_id, self.synthesize_fn(messages[clip_id])
+
+        results = {}
+        for future in [self.executor.submit(synthesize, cid) for cid in missing]:
+            try:
+                clip_id, audio = future.result()
+                results[clip_id] = audio
+            except Exception as e:
+                print(f"--- BROADCAST: TTS failed for one message: {e} ---")
+
+        # 3. Publish atomically; zones whose clip failed are left out
+        with self.lock:
+            for clip_id, audio in results.items():
+                self.clips[clip_id] = audio
+                if self.clip_dir:
+                    self._write_atomic(self._clip_path(clip_id), audio)
+            for clip_id in messages:
+                if clip_id in self.clips:
+                    self.clips.move_to_end(clip_id)
+            while len(self.clips) > self.max_cached_clips:
+                evicted, _ = self.clips.popitem(last=False)
+                if self.clip_dir:
+                    try:
+                        os.remove(self._clip_path(evicted))
+                    except FileNotFoundError:
+                        pass
+
+            self.published = {
+                "version": self.published["version"] + 1,
+                "generated_at": time.time(),
+                "zones": {z: info for z, info in zone_clips.items()
+                          if all(segment in self.clips for segment in info["segments"])},
+            }
+            if self.clip_dir:
+                self._write_atomic(os.path.join(self.clip_dir, "manifest.json"),
+                                   json.dumps(self.published).encode("utf-8"))
+
+        print(f"--- BROADCAST: {len(zone_clips)} zones, {len(messages)} distinct segments, "
+              f"{len(missing)} synthesized in {time.time() - started:.2f}s ---")
+
+    # --- Shared clip directory ---
+
+    def _clip_path(self, clip_id):
+        return os.path.join(self.clip_dir, f"{clip_id}.mp3")
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_manifest(self):
+        path = os.path.join(self.clip_dir, "manifest.json")
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {"version": 0, "generated_at": None, "zones": {}}
+        cached_mtime, cached = self.manifest_cache
+        if cached_mtime != mtime_ns:
+            with open(path) as f:
+                cached = json.load(f)
+            self.manifest_cache = (mtime_ns, cached)
+        return cached
@@ -0,0 +1,123 @@
+"""
+Contraction hierarchy (ch_router) vs. the plain A* search in find_safe_path.
+
+    python bench/ch_bench.py                       # graph.json + synthetic 10^2..10^4 node graphs
+    python bench/ch_bench.py --sizes 1000 --json
+
+For each graph it reports:
+  * preprocessing time and index memory (one-off, offline),
+  * customization time for a world state (danger nodes + crowd penalties),
+  * median query time for both engines and the speed-up,
+  * how many of the sampled queries got a different cost (should be 0).
+Synthetic graphs are the same jittered grids as routing_bench.py. Grids
+are the worst case for a CCH: their triangle count grows as n^1.5, so
+10^5-node grids exceed the default memory budget and are reported as skipped.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ch_router import CCHIndex, DEFAULT_MAX_TRIANGLES  # noqa: E402
+from routing import build_graph, find_safe_path  # noqa: E402
+from routing_bench import synthetic_node_list  # noqa: E402
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def bench_graph(name, node_list, queries, danger_count, crowd_count, max_triangles, seed=0):
+    rng = random.Random(seed)
+    ids = [node["id"] for node in node_list]
+    exit_nodes = [node["id"] for node in node_list if node.get("exit_node")]
+    G = build_graph(node_list)
+
+    try:
+        index, preprocess_seconds = timed(CCHIndex.build, node_list, max_triangles)
+    except ValueError as e:
+        return {"graph": name, "nodes": len(ids), "skipped": str(e)}
+
+    interior = [n for n in ids if n not in set(exit_nodes)]
+    danger = rng.sample(interior, min(danger_count, len(interior) // 4))
+    crowd = [{"node_id": n, "people_count": rng.randint(10, 200)}
+             for n in rng.sample(interior, min(crowd_count, len(interior) // 4))]
+    metric, customize_seconds = timed(index.customize, danger, crowd)
+
+    starts = [n for n in rng.choices(interior, k=queries) if n not in danger]
+    ch_times, search_times, mismatches = [], [], 0
+    for start in starts:
+        (_, ch_cost), ch_seconds = timed(metric.query, start)
+        (_, search_cost), search_seconds = timed(find_safe_path, G, exit_nodes, start, danger, crowd)
+        ch_times.append(ch_seconds)
+        search_times.append(search_seconds)
+        if abs(ch_cost - search_cost) > 1e-6 * max(1.0, search_cost) and ch_cost != search_cost:
+            mismatches += 1
+
+    ch_median, search_median = statistics.median(ch_times), statistics.median(search_times)
+    return {
+        "graph": name,
+        "nodes": len(ids),
+        "arcs": int(len(index.tail)),
+        "triangles": int(len(index.triangles)),
+        "preprocess_seconds": preprocess_seconds,
+        "index_mb": index.memory_bytes() / 1e6,
+        "customize_ms": customize_seconds * 1000,
+        "ch_query_us": ch_median * 1e6,
+        "search_query_us": search_median * 1e6,
+        "speedup": search_median / ch_median if ch_median else float("inf"),
+        # Queries after which customization has paid for itself
+        "break_even_queries": customize_seconds / max(search_median - ch_median, 1e-12),
+        "queries": len(starts),
+        "cost_mismatches": mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--graph", default=os.path.join(BACKEND_DIR, "graph.json"))
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--danger", type=int, default=2)
+    parser.add_argument("--crowd", type=int, default=10)
+    parser.add_argument("--max-triangles", type=int, default=DEFAULT_MAX_TRIANGLES)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    graphs = []
+    if os.path.exists(args.graph):
+        with open(args.graph) as f:
+            graphs.append((os.path.basename(args.graph), json.load(f)))
+    for n in (int(s) for s in args.sizes.split(",") if s):
+        graphs.append((f"grid-{n}", synthetic_node_list(n, seed=n)))
+
+    results = []
+    if not args.json:
+        print(f"{'graph':<14} {'nodes':>7} {'prep s':>7} {'MB':>7} {'custom ms':>10} "
+              f"{'CH us':>8} {'A* us':>10} {'speedup':>8} {'break-even':>10}  mismatches")
+    for name, node_list in graphs:
+        result = bench_graph(name, node_list, args.queries, args.danger, args.crowd, args.max_triangles)
+        results.append(result)
+        if args.json:
+            continue
+        if "skipped" in result:
+            print(f"{name:<14} {result['nodes']:>7}  skipped: {result['skipped']}")
+            continue
+        print(f"{name:<14} {result['nodes']:>7} {result['preprocess_seconds']:>7.2f} {result['index_mb']:>7.1f} "
+              f"{result['customize_ms']:>10.2f} {result['ch_query_us']:>8.1f} {result['search_query_us']:>10.1f} "
+              f"{result['speedup']:>7.0f}x {result['break_even_queries']:>10.0f}  {result['cost_mismatches']}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
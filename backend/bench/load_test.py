@@ -0,0 +1,163 @@
+"""
+Concurrent load generator for the local Aegis server.
+
+Examples (server running on localhost:8080):
+    python bench/load_test.py get_path --concurrency 32 --duration 20
+    python bench/load_test.py get_path --ramp 1,4,16,64,128 --slo-p99 0.25
+    python bench/load_test.py alert_clips --concurrency 16
+    python bench/load_test.py get_path --revalidate   # clients send If-None-Match
+
+Each worker thread keeps one HTTP/1.1 keep-alive connection and fires
+requests back to back. Reports p50/p95/p99/max latency and throughput;
+--ramp steps through concurrency levels and reports the highest
+throughput reached while p99 stays under --slo-p99. Only the standard
+library is used, so it runs offline next to the server.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+GRAPH_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "graph.json")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_start_nodes():
+    with open(GRAPH_PATH) as f:
+        return [node["id"] for node in json.load(f) if not node.get("exit_node", False)]
+
+
+def make_request_factory(scenario, start_nodes, hot_nodes):
+    """Returns a function producing (method, path) for the next request."""
+    if scenario == "get_path":
+        # "Everyone polls at once": most clients ask about a handful of nodes
+        def next_request():
+            pool = hot_nodes if hot_nodes and random.random() < 0.8 else start_nodes
+            return "GET", "/get_path?" + urlencode({"start_node": random.choice(pool)})
+    elif scenario == "alert_clips":
+        def next_request():
+            if random.random() < 0.5:
+                return "GET", "/alert_clips"
+            return "GET", f"/alert_clips/{random.choice(start_nodes)}"
+    elif scenario == "metrics":
+        def next_request():
+            return "GET", "/metrics"
+    else:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    return next_request
+
+
+def run_level(host, port, concurrency, duration, next_request, timeout, revalidate=False):
+    latencies, statuses, errors = [], {}, []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        local_latencies, local_statuses, local_errors = [], {}, 0
+        etags = {}  # path -> last ETag, like a browser cache
+        while time.perf_counter() < deadline:
+            method, path = next_request()
+            headers = {"If-None-Match": etags[path]} if revalidate and path in etags else {}
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.getheader("ETag"):
+                    etags[path] = response.getheader("ETag")
+                local_latencies.append(time.perf_counter() - started)
+                local_statuses[response.status] = local_statuses.get(response.status, 0) + 1
+            except Exception:
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else float("nan")) * 1000,
+    }
+
+
+def print_result(r):
+    print(f"  c={r['concurrency']:<4} {r['throughput_rps']:9.1f} req/s   "
+          f"p50 {r['p50_ms']:8.2f} ms   p95 {r['p95_ms']:8.2f} ms   "
+          f"p99 {r['p99_ms']:8.2f} ms   max {r['max_ms']:8.2f} ms   "
+          f"statuses {r['statuses']}   errors {r['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=["get_path", "alert_clips", "metrics"])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--ramp", help="Comma-separated concurrency levels, e.g. 1,4,16,64")
+    parser.add_argument("--slo-p99", type=float, default=0.5, help="p99 latency budget in seconds for --ramp")
+    parser.add_argument("--hot-nodes", default="P14,P5,P1", help="Start nodes most clients ask about")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--revalidate", action="store_true", help="Send If-None-Match with the last ETag per URL")
+    parser.add_argument("--json", dest="json_out", help="Write results to this file")
+    args = parser.parse_args()
+
+    start_nodes = load_start_nodes()
+    hot_nodes = [n for n in args.hot_nodes.split(",") if n]
+    next_request = make_request_factory(args.scenario, start_nodes, hot_nodes)
+    levels = [int(c) for c in args.ramp.split(",")] if args.ramp else [args.concurrency]
+
+    print(f"--- Load test: {args.scenario} against http://{args.host}:{args.port} ---")
+    results = []
+    for concurrency in levels:
+        result = run_level(args.host, args.port, concurrency, args.duration, next_request, args.timeout,
+                           revalidate=args.revalidate)
+        print_result(result)
+        results.append(result)
+
+    within_slo = [r for r in results if r["p99_ms"] <= args.slo_p99 * 1000 and r["errors"] == 0]
+    if within_slo:
+        best = max(within_slo, key=lambda r: r["throughput_rps"])
+        print(f"Max throughput within p99 <= {args.slo_p99 * 1000:.0f} ms: "
+              f"{best['throughput_rps']:.1f} req/s at concurrency {best['concurrency']}")
+    else:
+        print(f"No level met p99 <= {args.slo_p99 * 1000:.0f} ms without errors.")
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"scenario": args.scenario, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
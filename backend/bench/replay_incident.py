@@ -0,0 +1,127 @@
+"""
+Replays a recorded incident log through the routing core.
+
+    python bench/replay_incident.py incident_timeline.bin              # 10x real time
+    python bench/replay_incident.py incident_timeline.bin --speed 0    # as fast as possible
+    python bench/replay_incident.py incident_timeline.bin --start 1760000000 --end 1760000600 --json
+
+Every recorded world-state snapshot is routed for every zone exactly as
+the alert broadcaster does it, keeping the original spacing between
+snapshots divided by --speed, including the smoke spread check (pass the
+site's --wind and --spread-margin). Recorded route changes are compared
+against the replayed routes, so a run also shows whether routing still
+reproduces what happened. Routing time per snapshot is reported as p50/p95/max.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from incident_log import IncidentLogReader, replay  # noqa: E402
+from routing import build_graph, find_safe_path, with_stale_penalties  # noqa: E402
+from spread_model import SpreadModel, avoid_spread, parse_wind  # noqa: E402
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="Incident log written by the scanner")
+    parser.add_argument("--graph", default=os.path.join(BACKEND_DIR, "graph.json"))
+    parser.add_argument("--speed", type=float, default=10.0, help="Replay speed-up; 0 = no pacing")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="Longest pause between events, in replay seconds")
+    parser.add_argument("--start", type=float, default=None)
+    parser.add_argument("--end", type=float, default=None)
+    parser.add_argument("--stale-penalty", type=float, default=50.0,
+                        help="The server's STALE_NODE_PENALTY when the log was recorded")
+    parser.add_argument("--wind-speed", default="15mph", help="The site's wind speed")
+    parser.add_argument("--wind-direction", default="NW", help="Where the site's wind comes from")
+    parser.add_argument("--meters-per-unit", type=float, default=1.5)
+    parser.add_argument("--spread-margin", type=float, default=30.0,
+                        help="The server's SPREAD_MARGIN_SEC; negative disables the spread check")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    with open(args.graph) as f:
+        node_list = json.load(f)
+    G = build_graph(node_list)
+    exit_nodes = [node["id"] for node in node_list if node.get("exit_node", False)]
+    zones = [node["id"] for node in node_list if not node.get("exit_node", False)]
+    spread_model = SpreadModel(node_list, meters_per_unit=args.meters_per_unit)
+    wind = parse_wind({"speed": args.wind_speed, "direction": args.wind_direction})
+
+    records = IncidentLogReader(args.log).read(args.start, args.end, kinds=["snapshot", "route"])
+    routes = {}  # zone -> path under the latest replayed snapshot
+    snapshot_seconds = []
+    checked = mismatched = 0
+    first = last = None
+    wall_start = time.perf_counter()
+
+    for timestamp, kind, payload in replay(records, speed=args.speed, max_gap=args.max_gap):
+        first = timestamp if first is None else first
+        last = timestamp
+        if kind == "snapshot":
+            danger = payload.get("danger_nodes", [])
+            crowd = with_stale_penalties(payload.get("crowd_data", []), payload.get("stale_nodes", []),
+                                         args.stale_penalty)
+            started = time.perf_counter()
+            # Same rules as the broadcaster: all-clear routes nobody, danger zones get no path
+            routes = {}
+            unsafe_at = {}
+            if danger and args.spread_margin >= 0:
+                burning_for = {n: timestamp - t for n, t in payload.get("danger_since", {}).items()}
+                unsafe_at = dict(zip(spread_model.nodes,
+                                     spread_model.unsafe_times(danger, wind, burning_for).tolist()))
+            for zone in (zones if danger else []):
+                if zone in danger:
+                    routes[zone] = None
+                    continue
+                path, cost = find_safe_path(G, exit_nodes, zone, danger, crowd)
+                if unsafe_at:
+                    path = avoid_spread(G, exit_nodes, zone, path, cost, danger, crowd, unsafe_at,
+                                        args.meters_per_unit, margin=args.spread_margin)[0]
+                routes[zone] = path
+            snapshot_seconds.append(time.perf_counter() - started)
+        else:
+            for zone, path in payload.get("routes", {}).items():
+                if zone in routes:
+                    checked += 1
+                    mismatched += routes[zone] != path
+
+    wall = time.perf_counter() - wall_start
+    summary = {
+        "snapshots": len(snapshot_seconds),
+        "zones": len(zones),
+        "incident_seconds": (last - first) if first is not None else 0.0,
+        "replay_seconds": wall,
+        "route_changes_checked": checked,
+        "route_mismatches": mismatched,
+    }
+    if snapshot_seconds:
+        summary.update({
+            "snapshot_route_p50_ms": statistics.median(snapshot_seconds) * 1000,
+            "snapshot_route_p95_ms": percentile(snapshot_seconds, 0.95) * 1000,
+            "snapshot_route_max_ms": max(snapshot_seconds) * 1000,
+        })
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"Replayed {summary['snapshots']} snapshots x {summary['zones']} zones: "
+          f"{summary['incident_seconds']:.1f}s of incident in {wall:.2f}s")
+    if snapshot_seconds:
+        print(f"   routing per snapshot  p50 {summary['snapshot_route_p50_ms']:.2f} ms  "
+              f"p95 {summary['snapshot_route_p95_ms']:.2f} ms  max {summary['snapshot_route_max_ms']:.2f} ms")
+    print(f"   recorded route changes reproduced: {checked - mismatched}/{checked}")
+
+
+if __name__ == "__main__":
+    main()
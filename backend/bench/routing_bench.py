@@ -0,0 +1,245 @@
+"""
+Microbenchmarks for the routing engines on synthetic site graphs.
+
+    python bench/routing_bench.py                  # run and compare with baseline.json
+    python bench/routing_bench.py --sizes 100,1000 # smaller run
+    python bench/routing_bench.py --update-baseline
+
+Graphs are jittered grids in graph.json format with 10^2..10^5 nodes and
+exits on the boundary, built with build_graph(). /get_path answers from
+the precomputed scenario tables when the danger set has one, and falls
+back to the contraction hierarchy (or plain search without one), so
+each case runs one of the three engines the server uses:
+
+  * scenarios: ScenarioRoutes.lookup() on a table built for the case's
+    crowd state; only danger sets the table holds are sampled, so cases
+    with more danger nodes than any stored scenario are skipped,
+  * ch: CCHRouter.find_safe_path() with the customization for the
+    world state already cached, as for every request after the first,
+  * search: find_safe_path(), the plain A* search.
+
+Each case varies the number of danger nodes and crowd entries. Timings
+are stored as multiples of a fixed pure-Python calibration workload
+timed just before the case, which absorbs the machine speeding up or
+slowing down between runs. A case slower than `--tolerance` x its
+baseline fails the run with a non-zero exit code.
+
+baseline.json is not checked in: shared and virtual machines jitter far
+more than the tolerance between hosts. Record it on the base commit with
+--update-baseline, then run the comparison on the same machine.
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import sys
+import time
+import zlib
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from ch_router import CCHIndex, CCHRouter  # noqa: E402
+from routing import build_graph, crowd_signature, find_safe_path  # noqa: E402
+from scenario_routes import ScenarioRoutes  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+DEFAULT_ENGINES = ("scenarios", "ch", "search")
+DEFAULT_DANGER = (0, 1, 2, 8)
+DEFAULT_CROWD = (0, 10, 100)
+
+
+def synthetic_node_list(n, exits=8, seed=0, spacing=50):
+    """A jittered grid of ~n nodes, ~10% of edges dropped, exits on the boundary."""
+    rng = random.Random(seed)
+    side = max(2, int(math.ceil(math.sqrt(n))))
+    nodes = {}
+    for i in range(n):
+        r, c = divmod(i, side)
+        nodes[i] = {
+            "id": f"N{i}",
+            "x": c * spacing + rng.uniform(-spacing / 4, spacing / 4),
+            "y": r * spacing + rng.uniform(-spacing / 4, spacing / 4),
+            "adjacent": [],
+            "exit_node": False,
+            "name": f"Synthetic node {i}",
+        }
+
+    def link(a, b):
+        nodes[a]["adjacent"].append(nodes[b]["id"])
+        nodes[b]["adjacent"].append(nodes[a]["id"])
+
+    for i in range(n):
+        r, c = divmod(i, side)
+        right, down = i + 1, i + side
+        # Keep row 0 and column 0 fully connected so the graph stays connected
+        if c + 1 < side and right < n and (r == 0 or rng.random() > 0.1):
+            link(i, right)
+        if down < n and (c == 0 or rng.random() > 0.1):
+            link(i, down)
+
+    boundary = [i for i in range(n) if i < side or i % side in (0, side - 1) or i + side >= n]
+    for i in rng.sample(boundary, min(exits, len(boundary))):
+        nodes[i]["exit_node"] = True
+    return list(nodes.values())
+
+
+def calibrate(repeats=5, side=45):
+    """
+    Fastest seconds for a fixed pure-Python Dijkstra over a side x side grid.
+    It exercises the same interpreter paths as the engines (heapq, dicts,
+    tuples) but none of their code, so it tracks the machine, not a change.
+    """
+    adjacency = {}
+    for i in range(side * side):
+        r, c = divmod(i, side)
+        adjacency[i] = [(j, 1.0 + (i * 7 + j) % 5)
+                        for j, ok in ((i + 1, c + 1 < side), (i - 1, c > 0), (i + side, r + 1 < side), (i - side, r > 0))
+                        if ok]
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        dist, heap = {0: 0.0}, [(0.0, 0)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for v, w in adjacency[u]:
+                if d + w < dist.get(v, float("inf")):
+                    dist[v] = d + w
+                    heapq.heappush(heap, (d + w, v))
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def scenario_table(G, exit_nodes, crowd, max_table_bytes):
+    """A ScenarioRoutes with its table built for `crowd` on this thread (no background worker)."""
+    routes = ScenarioRoutes(G, exit_nodes, max_table_bytes=max_table_bytes)
+    routes.table = routes._build(G, exit_nodes, crowd)
+    return routes
+
+
+def run_case(engine, G, exit_nodes, interior, danger_count, crowd, repeats, seed, router=None, routes=None):
+    """Fastest seconds per query, or None if the engine can't serve this case."""
+    rng = random.Random(seed)
+    if engine == "scenarios":
+        # Only danger sets with a stored scenario are answered from the table
+        stored = [sorted(s) for s in routes.table["scenarios"] if len(s) == danger_count]
+        if not stored:
+            return None
+        danger_sets = [rng.choice(stored) for _ in range(repeats)]
+        query = lambda start, danger: routes.lookup(start, danger, crowd)  # noqa: E731
+    else:
+        if engine == "ch" and router is None:
+            return None
+        danger_sets = [rng.sample(interior, danger_count) for _ in range(repeats)]
+        if engine == "ch":
+            query = lambda start, danger: router.find_safe_path(start, danger, crowd)  # noqa: E731
+        else:
+            query = lambda start, danger: find_safe_path(G, exit_nodes, start, danger, crowd)  # noqa: E731
+
+    timings = []
+    for danger in danger_sets:
+        start = rng.choice([n for n in interior if n not in danger])
+        if engine == "ch":
+            router.metric(danger, crowd)  # customized once per world state, not per request
+        started = time.perf_counter()
+        query(start, danger)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def case_key(engine, n, danger, crowd):
+    return f"{engine}:n={n},danger={danger},crowd={crowd}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--engines", default=",".join(DEFAULT_ENGINES))
+    parser.add_argument("--danger", default=",".join(map(str, DEFAULT_DANGER)))
+    parser.add_argument("--crowd", default=",".join(map(str, DEFAULT_CROWD)))
+    parser.add_argument("--exits", type=int, default=8)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown vs baseline")
+    parser.add_argument("--scenario-table-mb", type=int, default=4,
+                        help="ScenarioRoutes table budget; lookups cost the same at any size")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    engines = [e for e in args.engines.split(",") if e]
+    danger_counts = [int(s) for s in args.danger.split(",")]
+    crowd_counts = [int(s) for s in args.crowd.split(",")]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("cases", {})
+
+    results, regressions = {}, []
+    print(f"{'case':<46} {'fastest':>12} {'x calib':>9} {'baseline':>9}  ratio")
+    for n in sizes:
+        node_list = synthetic_node_list(n, exits=args.exits, seed=n)
+        started = time.perf_counter()
+        G = build_graph(node_list)
+        build_seconds = time.perf_counter() - started
+        exit_nodes = [node["id"] for node in node_list if node["exit_node"]]
+        exit_set = set(exit_nodes)
+        interior = [node["id"] for node in node_list if node["id"] not in exit_set]
+        print(f"-- n={n}: {G.number_of_edges()} edges, build_graph {build_seconds * 1000:.1f} ms")
+
+        router = None
+        if "ch" in engines:
+            try:
+                router = CCHRouter(CCHIndex.build(node_list), max_metrics=1)
+            except ValueError as e:
+                print(f"   ch skipped: {e}")
+
+        # Fewer repeats on big graphs keep the full suite to a few minutes
+        repeats = max(3, min(50, 200000 // (n * len(danger_counts) * len(crowd_counts))))
+        for crowd_count in crowd_counts:
+            crowd_rng = random.Random(zlib.crc32(f"n={n},crowd={crowd_count}".encode()))
+            crowd = [{"node_id": node, "people_count": crowd_rng.randint(10, 200)}
+                     for node in crowd_rng.sample(interior, min(crowd_count, n // 2))]
+            # Scenario tables are only valid for the crowd state they were built with
+            routes = None
+            if "scenarios" in engines:
+                routes = scenario_table(G, exit_nodes, crowd, args.scenario_table_mb << 20)
+            for engine in engines:
+                for danger in danger_counts:
+                    key = case_key(engine, n, danger, crowd_count)
+                    calibration = calibrate()  # right before the case, to follow the machine's current speed
+                    fastest = run_case(engine, G, exit_nodes, interior, danger, crowd, repeats,
+                                      seed=zlib.crc32(key.encode()), router=router, routes=routes)
+                    if fastest is None:
+                        print(f"{key:<46} {'skipped':>12}")
+                        continue
+                    relative = fastest / calibration
+                    results[key] = relative
+                    reference = baseline.get(key)
+                    ratio = relative / reference if reference else float("nan")
+                    flag = "  <-- REGRESSION" if reference and ratio > args.tolerance else ""
+                    if flag:
+                        regressions.append(key)
+                    ref_str = f"{reference:9.4f}" if reference else f"{'-':>9}"
+                    print(f"{key:<46} {fastest * 1000:10.3f}ms {relative:9.4f} {ref_str}  {ratio:5.2f}{flag}")
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"unit": "calibration workload", "cases": baseline}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif regressions:
+        print(f"\nFAILED: {len(regressions)} case(s) slower than {args.tolerance}x baseline:")
+        for key in regressions:
+            print(f"   {key}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
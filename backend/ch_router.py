@@ -0,0 +1,394 @@
+"""
+Customizable contraction hierarchy (CCH) for start-to-nearest-exit routing.
+
+    python ch_router.py graph.json                      # writes graph.cch.npz next to it
+    python ch_router.py graph.json --out /tmp/site.cch.npz
+
+Three phases:
+
+1. Preprocessing (offline, metric-independent). Nodes are ordered by
+   geometric nested dissection on their map coordinates: split at the
+   median, rank the separator above both halves, recurse. Contracting in
+   that order adds shortcut arcs until the graph is chordal. Every
+   triangle (lower node, two upper neighbours) is listed once. This
+   depends only on the topology, so it is saved to disk and reused.
+
+2. Customization (per world state, a few vectorized NumPy passes). The
+   metric is the same one find_safe_path uses: Euclidean edge lengths
+   plus the crowd penalty of each crowded endpoint, with danger nodes
+   blocked. Arc weights are relaxed over triangles bottom-up. Then one
+   upward sweep from the open exits and one downward sweep give every
+   node's distance to its nearest exit.
+
+3. Query. The cost is an array lookup. The path is unpacked from the
+   per-node choices and each shortcut's middle node, so a query only
+   touches the nodes on its own path.
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from routing import crowd_signature
+
+LEAF_SIZE = 16
+INF = np.inf
+# Triangles dominate memory (12 bytes each). Corridor-like site graphs
+# stay far below this; dense grids grow as n^1.5 and hit it around 10^5 nodes.
+DEFAULT_MAX_TRIANGLES = 50_000_000
+
+
+def graph_checksum(node_list):
+    """Topology, coordinates and exits; a saved index is only valid for the same graph."""
+    canonical = sorted((n["id"], n["x"], n["y"], sorted(n["adjacent"]), bool(n.get("exit_node")))
+                       for n in node_list)
+    return hashlib.sha1(json.dumps(canonical).encode("utf-8")).hexdigest()
+
+
+def nested_dissection_order(xy, neighbors):
+    """Node indices, lowest rank first; each separator ranks above the parts it splits."""
+    order = []
+    # Explicit stack of (node indices, emit as-is) instead of recursion
+    stack = [(list(range(len(xy))), False)]
+    while stack:
+        part, emit = stack.pop()
+        if emit or len(part) <= LEAF_SIZE:
+            order.extend(part)
+            continue
+        coords = xy[part]
+        axis = int(np.argmax(coords.max(axis=0) - coords.min(axis=0)))
+        in_left = coords[:, axis] < np.median(coords[:, axis])
+        if in_left.all() or not in_left.any():
+            in_left = np.arange(len(part)) < len(part) // 2  # every node on one coordinate
+        left = {v for v, is_left in zip(part, in_left) if is_left}
+        right = set(part) - left
+        # The separator is whichever side of the cut has fewer boundary nodes
+        left_boundary = {v for v in left if any(u in right for u in neighbors[v])}
+        right_boundary = {v for v in right if any(u in left for u in neighbors[v])}
+        separator = left_boundary if len(left_boundary) <= len(right_boundary) else right_boundary
+        # Popped in reverse: left part, right part, then the separator
+        stack.append((sorted(separator), True))
+        stack.append((sorted(right - separator), False))
+        stack.append((sorted(left - separator), False))
+    return order
+
+
+class CCHIndex:
+    """The metric-independent part: node order, chordal arcs and triangles."""
+
+    def __init__(self, node_ids, exit_mask, base_weight, tail, head, level, triangles, checksum):
+        self.node_ids = list(node_ids)
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.exit_mask = np.asarray(exit_mask, dtype=bool)
+        self.base_weight = np.asarray(base_weight, dtype=np.float64)  # per arc; inf for pure shortcuts
+        self.tail = np.ascontiguousarray(tail, dtype=np.int32)  # lower-ranked endpoint of each arc
+        self.head = np.ascontiguousarray(head, dtype=np.int32)  # higher-ranked endpoint
+        self.level = np.asarray(level, dtype=np.int32)  # elimination-tree level of each node
+        # (n, 3) arc ids: low->u, low->w, u->w; sorted by the level of `low`
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.int32).reshape(-1, 3)
+        self.checksum = checksum
+        # Plain-int views for the query loop (no NumPy scalar overhead)
+        self.tail_view = memoryview(self.tail)
+        self.head_view = memoryview(self.head)
+
+        # Arcs and triangles grouped by the level of their lowest node, for
+        # the level-synchronous sweeps in customize()
+        arc_levels = self.level[self.tail]
+        order = np.argsort(arc_levels, kind="stable")
+        self.arc_groups = np.split(order, np.flatnonzero(np.diff(arc_levels[order])) + 1)
+        triangle_levels = arc_levels[self.triangles[:, 0]]
+        bounds = np.r_[0, np.flatnonzero(np.diff(triangle_levels)) + 1, len(triangle_levels)]
+        self.triangle_groups = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    @classmethod
+    def build(cls, node_list, max_triangles=DEFAULT_MAX_TRIANGLES):
+        node_ids = [n["id"] for n in node_list]
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        xy = np.array([(n["x"], n["y"]) for n in node_list], dtype=np.float64)
+        neighbors = [set() for _ in node_ids]
+        for n in node_list:
+            for other in n["adjacent"]:
+                if other in index and other != n["id"]:
+                    neighbors[index[n["id"]]].add(index[other])
+                    neighbors[index[other]].add(index[n["id"]])
+
+        order = nested_dissection_order(xy, neighbors)
+        rank = np.empty(len(node_ids), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+
+        # Contraction: each node's upper neighbours are merged into its
+        # lowest upper neighbour (its elimination-tree parent); this is
+        # the usual way to compute the chordal completion.
+        upper = [{u for u in neighbors[v] if rank[u] > rank[v]} for v in range(len(node_ids))]
+        level = np.zeros(len(node_ids), dtype=np.int64)
+        for v in order:
+            if upper[v]:
+                parent = min(upper[v], key=rank.__getitem__)
+                upper[parent] |= upper[v] - {parent}
+                for u in upper[v]:
+                    level[u] = max(level[u], level[v] + 1)
+
+        up_degree = np.array([len(u) for u in upper], dtype=np.int64)
+        triangle_count = int((up_degree * (up_degree - 1) // 2).sum())
+        if triangle_count > max_triangles:
+            raise ValueError(f"Contraction needs {triangle_count} triangles (limit {max_triangles}); "
+                             f"this graph is too grid-like for a CCH within the memory budget.")
+
+        tail, head = [], []
+        for v in order:
+            for u in sorted(upper[v], key=rank.__getitem__):
+                tail.append(v)
+                head.append(u)
+        tail = np.array(tail, dtype=np.int64)
+        head = np.array(head, dtype=np.int64)
+
+        base_weight = np.full(len(tail), INF)
+        original = np.array([u in neighbors[v] for v, u in zip(tail.tolist(), head.tolist())], dtype=bool)
+        base_weight[original] = np.hypot(*(xy[tail[original]] - xy[head[original]]).T)
+
+        # Triangles: for every node, each pair of its upper neighbours is an arc
+        n = len(node_ids)
+        keys = tail * n + head
+        key_order = np.argsort(keys)
+        sorted_keys = keys[key_order]
+        arc_start = np.zeros(n + 1, dtype=np.int64)
+        np.add.at(arc_start, tail + 1, 1)
+        arc_start = np.cumsum(arc_start)
+        arc_by_tail = np.argsort(tail, kind="stable")
+        triangles = []
+        for v in range(n):
+            arcs = arc_by_tail[arc_start[v]:arc_start[v + 1]]  # upward arcs of v, by head rank
+            if len(arcs) < 2:
+                continue
+            # arcs are sorted by head rank, so head[arcs[i]] ranks below head[arcs[j]]
+            i, j = np.triu_indices(len(arcs), k=1)
+            top = key_order[np.searchsorted(sorted_keys, head[arcs[i]] * n + head[arcs[j]])]
+            triangles.append(np.stack([arcs[i], arcs[j], top], axis=1))
+        triangles = np.concatenate(triangles) if triangles else np.zeros((0, 3), dtype=np.int64)
+        triangles = triangles[np.argsort(level[tail[triangles[:, 0]]], kind="stable")]
+
+        exit_mask = np.array([bool(n.get("exit_node")) for n in node_list])
+        return cls(node_ids, exit_mask, base_weight, tail, head, level, triangles, graph_checksum(node_list))
+
+    def save(self, path):
+        """Writes to a temp file next to path and renames it, so readers never see a partial index."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f, node_ids=np.array(self.node_ids), exit_mask=self.exit_mask, base_weight=self.base_weight,
+                    tail=self.tail, head=self.head, level=self.level, triangles=self.triangles,
+                    checksum=np.array(self.checksum),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["node_ids"].tolist(), data["exit_mask"], data["base_weight"], data["tail"],
+                       data["head"], data["level"], data["triangles"], str(data["checksum"]))
+
+    @classmethod
+    def load_or_build(cls, path, node_list):
+        """
+        Uses the saved index if it matches node_list, otherwise rebuilds (and
+        saves) it. An unreadable index file also means a rebuild.
+        """
+        if path and os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.checksum == graph_checksum(node_list):
+                    return index
+            except Exception as e:
+                print(f"--- CCH: could not read {path}, rebuilding: {e} ---")
+        index = cls.build(node_list)
+        if path:
+            try:
+                index.save(path)
+            except OSError as e:
+                print(f"--- CCH: could not save {path}: {e} ---")
+        return index
+
+    def memory_bytes(self):
+        arrays = (self.exit_mask, self.base_weight, self.tail, self.head, self.level, self.triangles)
+        return sum(a.nbytes for a in arrays)
+
+    def metric_bytes(self):
+        """Memory held by one CCHMetric: per-arc weight and via arcs, per-node distances and arcs."""
+        return len(self.tail) * (8 + 4 + 4) + len(self.node_ids) * (8 + 8 + 4 + 4)
+
+    def customize(self, danger_nodes=(), crowd_data=()):
+        return CCHMetric(self, danger_nodes, crowd_data)
+
+
+class CCHMetric:
+    """One customization: arc weights and distance-to-nearest-exit for a world state."""
+
+    def __init__(self, index, danger_nodes, crowd_data):
+        self.index = index
+        tail, head = index.tail, index.head
+        n = len(index.node_ids)
+
+        blocked = np.zeros(n, dtype=bool)
+        for node in danger_nodes:
+            if node in index.index:
+                blocked[index.index[node]] = True
+        # Same crowd penalty as apply_world_state: added for each crowded endpoint
+        penalty = np.zeros(n)
+        for crowd in crowd_data:
+            if crowd.get("node_id") in index.index:
+                penalty[index.index[crowd["node_id"]]] += crowd.get("people_count", 0)
+
+        weight = index.base_weight + penalty[tail] + penalty[head]
+        weight[blocked[tail] | blocked[head]] = INF
+        original = weight.copy()
+
+        # 1. Triangle relaxation, lowest level first: arc (u, w) may be
+        # shortcut through any lower node adjacent to both.
+        triangles = index.triangles
+        for group in index.triangle_groups:
+            tri = triangles[group]
+            np.minimum.at(weight, tri[:, 2], weight[tri[:, 0]] + weight[tri[:, 1]])
+        self.weight = weight
+
+        # For every arc whose weight comes from a shortcut, the two arcs
+        # through its middle node: middle->tail and middle->head
+        via_tail = np.full(len(weight), -1, dtype=np.int32)
+        via_head = np.full(len(weight), -1, dtype=np.int32)
+        if len(triangles):
+            candidate = weight[triangles[:, 0]] + weight[triangles[:, 1]]
+            via = (candidate == weight[triangles[:, 2]]) & (candidate < original[triangles[:, 2]])
+            via_tail[triangles[via, 2]] = triangles[via, 0]
+            via_head[triangles[via, 2]] = triangles[via, 1]
+        self.via_tail, self.via_head = memoryview(via_tail), memoryview(via_head)
+
+        # 2. Upward sweep from every open exit: best distance from any exit
+        # to each node using only upward arcs (i.e. node -> exit going down)
+        sources = index.exit_mask & ~blocked
+        down = np.where(sources, 0.0, INF)
+        for group in index.arc_groups:
+            np.minimum.at(down, head[group], down[tail[group]] + weight[group])
+        self.down = down
+        # For each node, the arc its downward distance comes through
+        down_arc = np.full(n, -1, dtype=np.int32)
+        reached = np.isfinite(down[tail]) & (down[tail] + weight == down[head]) & ~sources[head]
+        down_arc[head[reached]] = np.flatnonzero(reached)
+        self.down_arc = memoryview(down_arc)
+
+        # 3. Downward sweep, highest level first: distance to the nearest
+        # exit over any up-then-down path
+        dist = down.copy()
+        for group in reversed(index.arc_groups):
+            np.minimum.at(dist, tail[group], dist[head[group]] + weight[group])
+        self.dist = dist
+        up_arc = np.full(n, -1, dtype=np.int32)
+        climbs = np.isfinite(dist[head]) & (dist[head] + weight == dist[tail]) & (dist[tail] < down[tail])
+        up_arc[tail[climbs]] = np.flatnonzero(climbs)
+        self.up_arc = memoryview(up_arc)
+
+    def _unpack(self, arc, forward, path):
+        """Appends the original nodes of an arc, walking tail->head if forward."""
+        stack = [(arc, forward)]
+        tail, head = self.index.tail_view, self.index.head_view
+        while stack:
+            a, fwd = stack.pop()
+            low_u, low_w = self.via_tail[a], self.via_head[a]  # middle -> tail(a), middle -> head(a)
+            if low_u < 0:
+                path.append(head[a] if fwd else tail[a])
+                continue
+            # tail(a) -> middle -> head(a) when forward; reversed otherwise
+            if fwd:
+                stack.append((low_w, True))
+                stack.append((low_u, False))
+            else:
+                stack.append((low_u, True))
+                stack.append((low_w, False))
+
+    def query(self, start_node):
+        """(path, cost) to the nearest open exit, or (None, inf)."""
+        index = self.index
+        start = index.index.get(start_node)
+        if start is None or not np.isfinite(self.dist[start]):
+            return None, float("inf")
+
+        path = [start]
+        current = start
+        arc = self.up_arc[current]
+        while arc >= 0:  # climb while that is cheaper
+            self._unpack(arc, True, path)
+            current = index.head_view[arc]
+            arc = self.up_arc[current]
+        arc = self.down_arc[current]
+        while arc >= 0:  # then descend to the exit
+            self._unpack(arc, False, path)
+            current = index.tail_view[arc]
+            arc = self.down_arc[current]
+        return [index.node_ids[i] for i in path], float(self.dist[start])
+
+
+class CCHRouter:
+    """
+    Drop-in for find_safe_path backed by a CCHIndex. Customizations are
+    cached per (danger set, crowd state), so every request under the same
+    world state is a pure query.
+    """
+
+    def __init__(self, index, max_metrics=8):
+        self.index = index
+        self.max_metrics = max_metrics
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def metric(self, danger_nodes, crowd_data):
+        key = (frozenset(n for n in danger_nodes if n in self.index.index), crowd_signature(crowd_data))
+        with self.lock:
+            metric = self.metrics.get(key)
+            if metric is not None:
+                self.metrics.move_to_end(key)
+                return metric
+        metric = self.index.customize(key[0], crowd_data)
+        with self.lock:
+            self.metrics[key] = metric
+            while len(self.metrics) > self.max_metrics:
+                self.metrics.popitem(last=False)
+        return metric
+
+    def find_safe_path(self, start_node, danger_nodes, crowd_data):
+        if start_node in danger_nodes:
+            return None, float("inf")
+        return self.metric(danger_nodes, crowd_data).query(start_node)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("graph", help="graph.json node list")
+    parser.add_argument("--out", default=None, help="Defaults to <graph>.cch.npz")
+    parser.add_argument("--max-triangles", type=int, default=DEFAULT_MAX_TRIANGLES)
+    args = parser.parse_args()
+
+    with open(args.graph) as f:
+        node_list = json.load(f)
+    out = args.out or os.path.splitext(args.graph)[0] + ".cch.npz"
+    started = time.perf_counter()
+    index = CCHIndex.build(node_list, max_triangles=args.max_triangles)
+    print(f"Preprocessed {len(node_list)} nodes in {time.perf_counter() - started:.2f}s: "
+          f"{len(index.tail)} arcs, {len(index.triangles)} triangles, "
+          f"{len(index.arc_groups)} levels, {index.memory_bytes() / 1e6:.1f} MB")
+    index.save(out)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
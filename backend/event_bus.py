@@ -0,0 +1,111 @@
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+# --- In-Process Event Bus ---
+# Publish/subscribe for voice session events. Any number of subscribers
+# can attach to a topic (a session ID) or to every topic ("*"). Each one
+# gets its own bounded buffer and drop policy, so a slow consumer never
+# blocks the publisher or the other subscribers. The last event of each
+# type ("location", "message", "ended", ...) is retained per topic and
+# replayed to late joiners in publish order, so a late joiner still learns
+# the session's location even if chat messages followed it.
+# publish() is thread-safe; subscriptions are consumed from the event loop.
+
+ALL_TOPICS = "*"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class Subscription:
+    def __init__(self, bus, topic, maxsize, drop_policy, loop):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.bus = bus
+        self.topic = topic
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.loop = loop
+        self.buffer = deque()
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def _offer(self, event):
+        # Called with the bus lock held, possibly from another thread
+        if len(self.buffer) >= self.maxsize:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return
+            self.buffer.popleft()
+        self.buffer.append(event)
+        self.loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self, timeout=None):
+        """Next event, or None on timeout / after close()."""
+        while True:
+            with self.bus.lock:
+                if self.buffer:
+                    return self.buffer.popleft()
+                if self.closed:
+                    return None
+                self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def close(self):
+        self.bus._unsubscribe(self)
+        self.closed = True
+        self.loop.call_soon_threadsafe(self._ready.set)
+
+
+class EventBus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # topic -> set of Subscription
+        self.last_events = {}  # topic -> {event type: last published event of that type}
+        self.sequence = itertools.count(1)
+
+    def publish(self, topic, event):
+        with self.lock:
+            event = dict(event, seq=next(self.sequence))
+            self.last_events.setdefault(topic, {})[event.get("type")] = event
+            for sub in self.subscribers.get(topic, ()):
+                sub._offer(event)
+            for sub in self.subscribers.get(ALL_TOPICS, ()):
+                sub._offer(event)
+        return event
+
+    def subscribe(self, topic, maxsize=100, drop_policy=DROP_OLDEST, replay_last=True):
+        """Must be called from the event loop that will consume the events."""
+        sub = Subscription(self, topic, maxsize, drop_policy, asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.setdefault(topic, set()).add(sub)
+            if replay_last and topic != ALL_TOPICS:
+                for event in sorted(self.last_events.get(topic, {}).values(), key=lambda e: e["seq"]):
+                    sub._offer(event)
+        return sub
+
+    def last_event(self, topic, event_type=None):
+        """The topic's latest retained event, or its latest of event_type."""
+        with self.lock:
+            retained = self.last_events.get(topic, {})
+            if event_type is not None:
+                return retained.get(event_type)
+            return max(retained.values(), key=lambda e: e["seq"], default=None)
+
+    def forget(self, topic):
+        """Drops the retained events of a finished topic."""
+        with self.lock:
+            self.last_events.pop(topic, None)
+
+    def _unsubscribe(self, sub):
+        with self.lock:
+            subs = self.subscribers.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.subscribers[sub.topic]
@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from admission import Overloaded
+
+# --- Fair Shared Worker Pool ---
+# One bounded pool for the slow upstream work (frame decode, uploads and
+# VLM calls, TTS) of every site served by the process. Work is queued per
+# tenant (site ID) and workers take turns between tenants round-robin, so
+# a site with a burst of work (a big alert broadcast) can't starve the
+# other sites' scan cycles: each site waits at most one task per other
+# busy site for the next free worker. Each tenant's queue is capped at
+# max_queued; beyond that submit() raises admission.Overloaded, so a stuck
+# upstream can't grow the queues without bound.
+
+
+class TenantExecutor:
+    """One tenant's view of a FairExecutor, usable wherever an Executor's submit() is."""
+
+    def __init__(self, pool, tenant):
+        self.pool = pool
+        self.tenant = tenant
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(self.tenant, fn, *args, **kwargs)
+
+
+class FairExecutor:
+    def __init__(self, max_workers=8, max_queued=256, name="fair-pool"):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.queues = OrderedDict()  # tenant -> deque of (future, fn, args, kwargs); rotation order
+        self.running = {}  # tenant -> tasks running
+        self.completed = {}  # tenant -> tasks finished
+        self.rejected = {}  # tenant -> submits refused because the queue was full
+        self.workers = [threading.Thread(target=self._work, daemon=True, name=f"{name}-{i}")
+                        for i in range(max_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, tenant, fn, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            queue = self.queues.get(tenant, ())
+            if len(queue) >= self.max_queued:
+                self.rejected[tenant] = self.rejected.get(tenant, 0) + 1
+                raise Overloaded(f"{len(queue)} upstream tasks already queued for '{tenant}'.")
+            self.queues.setdefault(tenant, deque()).append((future, fn, args, kwargs))
+            self.ready.notify()
+        return future
+
+    def for_tenant(self, tenant):
+        return TenantExecutor(self, tenant)
+
+    def stats(self):
+        with self.lock:
+            tenants = set(self.queues) | set(self.running) | set(self.completed) | set(self.rejected)
+            return {
+                "max_workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "tenants": {t: {"queued": len(self.queues.get(t, ())),
+                                "running": self.running.get(t, 0),
+                                "completed": self.completed.get(t, 0),
+                                "rejected": self.rejected.get(t, 0)} for t in sorted(tenants)},
+            }
+
+    def _next(self):
+        """Next task round-robin across tenants. Called with the lock held."""
+        tenant, queue = next(iter(self.queues.items()))
+        task = queue.popleft()
+        del self.queues[tenant]
+        if queue:
+            self.queues[tenant] = queue  # back of the rotation
+        return tenant, task
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while not self.queues:
+                    self.ready.wait()
+                tenant, (future, fn, args, kwargs) = self._next()
+                self.running[tenant] = self.running.get(tenant, 0) + 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.running[tenant] -= 1
+                    self.completed[tenant] = self.completed.get(tenant, 0) + 1
@@ -0,0 +1,214 @@
+import bisect
+import json
+import os
+import struct
+import threading
+import time
+
+# --- Incident Timeline Recorder ---
+# Append-only binary log of everything the scanner decided during an
+# incident: published world-state snapshots, raw VLM verdicts and per-zone
+# route changes. Each record is a fixed header (timestamp, kind, payload
+# length) followed by compact JSON, and timestamps never go backwards.
+#
+# A sidecar ".idx" file holds (timestamp, offset) for every INDEX_EVERY-th
+# record, so loading a time window is a bisect over the index plus a short
+# forward scan rather than a pass over the whole log.
+#
+# Only the scanner process writes; any process can read while it does.
+
+RECORD = struct.Struct("<dBI")  # timestamp, kind, payload length
+INDEX_ENTRY = struct.Struct("<dQ")  # timestamp, record offset
+INDEX_EVERY = 32
+
+SNAPSHOT, VERDICT, ROUTE = 1, 2, 3
+KIND_NAMES = {SNAPSHOT: "snapshot", VERDICT: "verdict", ROUTE: "route"}
+KINDS = {name: kind for kind, name in KIND_NAMES.items()}
+
+
+def index_path_for(path):
+    return path + ".idx"
+
+
+def read_index(index_path):
+    """Returns (timestamps, offsets) from an index file; incomplete entries are ignored."""
+    try:
+        with open(index_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return [], []
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    entries = list(INDEX_ENTRY.iter_unpack(data[:usable]))
+    return [t for t, _ in entries], [o for _, o in entries]
+
+
+def iter_records(f, offset=0):
+    """Yields (offset, timestamp, kind, payload bytes) until EOF or a torn record."""
+    f.seek(offset)
+    while True:
+        header = f.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return
+        timestamp, kind, length = RECORD.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length:
+            return  # writer is mid-append, or a crash left a partial tail
+        yield offset, timestamp, kind, payload
+        offset += RECORD.size + length
+
+
+class IncidentRecorder:
+    """The single writer. Thread-safe; every append is flushed immediately."""
+
+    def __init__(self, path, index_every=INDEX_EVERY):
+        self.path = path
+        self.index_path = index_path_for(path)
+        self.index_every = index_every
+        self.lock = threading.Lock()
+        self.last_routes = {}  # zone -> last recorded path
+        self._recover()
+        self.log = open(path, "ab")
+        self.index = open(self.index_path, "ab")
+
+    def _recover(self):
+        """Drops a torn tail left by a crash and works out where appending resumes."""
+        timestamps, offsets = read_index(self.index_path)
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        valid = bisect.bisect_left(offsets, size)
+        timestamps, offsets = timestamps[:valid], offsets[:valid]
+
+        self.last_timestamp = timestamps[-1] if timestamps else 0.0
+        self.size = offsets[-1] if offsets else 0
+        # Records since (and including) the last indexed one
+        self.unindexed = 0 if offsets else self.index_every
+        if size:
+            with open(self.path, "rb") as f:
+                for offset, timestamp, _, payload in iter_records(f, self.size):
+                    self.last_timestamp = timestamp
+                    self.size = offset + RECORD.size + len(payload)
+                    self.unindexed += 1
+        if size > self.size:
+            with open(self.path, "r+b") as f:
+                f.truncate(self.size)
+        with open(self.index_path, "wb") as f:
+            f.write(b"".join(INDEX_ENTRY.pack(t, o) for t, o in zip(timestamps, offsets)))
+
+    def append(self, kind, payload, timestamp=None):
+        data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        with self.lock:
+            timestamp = max(timestamp or time.time(), self.last_timestamp)
+            offset = self.size
+            self.log.write(RECORD.pack(timestamp, kind, len(data)) + data)
+            self.log.flush()
+            # The index is written after the record, so it never points past the log
+            if self.unindexed >= self.index_every:
+                self.index.write(INDEX_ENTRY.pack(timestamp, offset))
+                self.index.flush()
+                self.unindexed = 0
+            self.unindexed += 1
+            self.size = offset + RECORD.size + len(data)
+            self.last_timestamp = timestamp
+        return timestamp
+
+    def record_snapshot(self, version, state):
+        return self.append(SNAPSHOT, dict(state, version=version), timestamp=state.get("updated_at"))
+
+    def record_verdict(self, verdict):
+        return self.append(VERDICT, verdict)
+
+    def record_routes(self, zone_paths):
+        """Records only the zones whose route differs from the last one recorded."""
+        with self.lock:
+            changes = {zone: path for zone, path in zone_paths.items()
+                       if zone not in self.last_routes or self.last_routes[zone] != path}
+            self.last_routes.update(changes)
+        if changes:
+            self.append(ROUTE, {"routes": changes})
+        return changes
+
+    def close(self):
+        with self.lock:
+            self.log.close()
+            self.index.close()
+
+
+class IncidentLogReader:
+    """Reads time windows from a log that may still be growing."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = index_path_for(path)
+        self.index_cache = (None, [], [])  # (index file size, timestamps, offsets)
+
+    def _index(self):
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return [], []
+        if self.index_cache[0] != size:
+            self.index_cache = (size,) + read_index(self.index_path)
+        return self.index_cache[1], self.index_cache[2]
+
+    def read(self, start=None, end=None, kinds=None, limit=None):
+        """
+        Yields (timestamp, kind name, payload dict) for records with
+        start <= timestamp <= end, oldest first.
+        """
+        timestamps, offsets = self._index()
+        offset = 0
+        if start is not None:
+            # Last indexed record strictly before `start`; nothing earlier can match
+            position = bisect.bisect_left(timestamps, start) - 1
+            if position >= 0:
+                offset = offsets[position]
+        wanted = None if kinds is None else {KINDS[k] if isinstance(k, str) else k for k in kinds}
+
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        count = 0
+        with f:
+            for _, timestamp, kind, payload in iter_records(f, offset):
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp > end:
+                    return
+                if wanted is not None and kind not in wanted:
+                    continue
+                yield timestamp, KIND_NAMES.get(kind, str(kind)), json.loads(payload)
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def bounds(self):
+        """(first timestamp, last timestamp) of the log, or (None, None) if empty."""
+        first = last = None
+        _, offsets = self._index()
+        try:
+            with open(self.path, "rb") as f:
+                for _, first, _, _ in iter_records(f, 0):
+                    break
+                for _, last, _, _ in iter_records(f, offsets[-1] if offsets else 0):
+                    pass
+        except FileNotFoundError:
+            pass
+        return first, last
+
+
+def replay(records, speed=10.0, max_gap=None, sleep=time.sleep):
+    """
+    Re-emits (timestamp, kind, payload) records with their original spacing
+    divided by `speed`. speed <= 0 replays as fast as possible; max_gap caps
+    any single pause (in replay seconds), e.g. for quiet hours between incidents.
+    """
+    previous = None
+    for record in records:
+        if previous is not None and speed > 0:
+            gap = (record[0] - previous) / speed
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            if gap > 0:
+                sleep(gap)
+        previous = record[0]
+        yield record
@@ -0,0 +1,200 @@
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+# --- Spoken Location Resolver ---
+# Maps a (possibly partial) transcript like "I'm by the oval" to graph
+# nodes. The index is built once at startup over node IDs, names, the
+# parts of each name, and optional "aliases" from graph.json. Parts of a
+# parenthetical ("near Bing Concert Hall") only count as FRAGMENT_SCORE of
+# a full match, and parts made only of generic words ("road", "Southeast
+# Corner") aren't indexed on their own at all.
+#   * token -> phrases inverted index, weighted by IDF
+#   * character trigram -> vocabulary index for typo/ASR-error matching,
+#     verified with a bounded edit distance
+# A query only touches phrases that share a token with the transcript,
+# so it stays well under a millisecond with thousands of named places.
+
+STOPWORDS = {
+    "a", "an", "the", "of", "at", "in", "on", "by", "near", "to", "and", "i", "im", "i'm",
+    "am", "is", "its", "it's", "we", "were", "we're", "my", "me", "next", "close", "right",
+    "outside", "inside", "around", "front", "um", "uh", "like", "just", "so", "yes", "yeah",
+}
+NODE_ID_PATTERN = re.compile(r'\bP\s?(\d+)\b', re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+# Words that don't name a place by themselves
+GENERIC_WORDS = {
+    "road", "street", "st", "drive", "way", "mall", "avenue", "lane", "path", "corner", "building",
+    "center", "centre", "hall", "entrance", "side", "area", "north", "south", "east", "west",
+    "northeast", "northwest", "southeast", "southwest", "upper", "lower", "main",
+}
+FRAGMENT_SCORE = 0.8
+
+
+def tokenize(text):
+    return [t.replace("'", "") for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            current.append(cost)
+            row_min = min(row_min, cost)
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def name_phrases(node):
+    """
+    (phrase, score) for the full name, the name without its parenthetical,
+    and each specific part inside it; the parts score FRAGMENT_SCORE.
+    """
+    name = node.get("name", "")
+    phrases = [(name, 1.0)]
+    outer = re.sub(r"\(.*?\)", " ", name).strip()
+    if outer and outer != name:
+        phrases.append((outer, 1.0))
+    for inner in re.findall(r"\((.*?)\)", name):
+        for part in inner.split(","):
+            if any(t not in GENERIC_WORDS for t in tokenize(part)):
+                phrases.append((part.strip(), FRAGMENT_SCORE))
+    phrases.extend((alias, 1.0) for alias in node.get("aliases", []))
+    return phrases
+
+
+class LocationResolver:
+    def __init__(self, node_list, max_token_candidates=8):
+        self.node_ids = {node["id"].upper(): node["id"] for node in node_list}
+        self.node_names = {node["id"]: node.get("name", node["id"]) for node in node_list}
+        self.max_token_candidates = max_token_candidates
+
+        # Phrase table: (node_id, phrase text, unique tokens); phrase_scores
+        # holds each phrase's score for a full match
+        self.phrases = []
+        self.phrase_scores = []
+        token_phrases = defaultdict(set)
+        seen = set()
+        for node in node_list:
+            for phrase, score in name_phrases(node):
+                tokens = tuple(dict.fromkeys(tokenize(phrase)))
+                if not tokens or (node["id"], tokens) in seen:
+                    continue
+                seen.add((node["id"], tokens))
+                for token in tokens:
+                    token_phrases[token].add(len(self.phrases))
+                self.phrases.append((node["id"], phrase, tokens))
+                self.phrase_scores.append(score)
+
+        # IDF over phrases: rare words ("hoover") count more than "street"
+        n = max(1, len(self.phrases))
+        self.idf = {t: math.log(1 + n / len(ids)) for t, ids in token_phrases.items()}
+        self.phrase_weights = [sum(self.idf[t] for t in tokens) for _, _, tokens in self.phrases]
+        self.token_phrases = {t: tuple(ids) for t, ids in token_phrases.items()}
+
+        self.trigram_index = defaultdict(set)
+        for token in self.token_phrases:
+            for gram in trigrams(token):
+                self.trigram_index[gram].add(token)
+
+        self.match_token = lru_cache(maxsize=4096)(self._match_token)
+
+    def _match_token(self, token):
+        """Vocabulary tokens similar to `token`, as (vocab_token, similarity)."""
+        if token in self.token_phrases:
+            return ((token, 1.0),)
+        if len(token) < 3 or token.isdigit():
+            return ()
+
+        counts = defaultdict(int)
+        for gram in trigrams(token):
+            for candidate in self.trigram_index.get(gram, ()):
+                counts[candidate] += 1
+        ranked = sorted(counts.items(), key=lambda kv: -kv[1])[:self.max_token_candidates]
+
+        limit = 1 if len(token) <= 5 else 2
+        matches = []
+        for candidate, _ in ranked:
+            distance = bounded_edit_distance(token, candidate, limit)
+            if distance <= limit:
+                matches.append((candidate, 1.0 - distance / max(len(token), len(candidate))))
+        return tuple(matches)
+
+    def resolve(self, text, top_k=3):
+        """
+        Returns up to top_k candidates, best first, as dicts with node_id,
+        confidence (0..1) and the phrase that matched.
+        """
+        return [candidate for candidate, _ in self._rank(text)[:top_k]]
+
+    def _rank(self, text):
+        """Every matching (candidate, evidence) pair, best first."""
+        explicit = [m.group(1) for m in NODE_ID_PATTERN.finditer(text)]
+        for number in explicit:
+            node_id = self.node_ids.get(f"P{number}")
+            if node_id:
+                return [({"node_id": node_id, "confidence": 1.0, "matched": node_id}, 0.0)]
+
+        # Best similarity seen for each vocabulary token in the transcript
+        similarity = {}
+        for token in tokenize(text):
+            for vocab_token, score in self.match_token(token):
+                if score > similarity.get(vocab_token, 0.0):
+                    similarity[vocab_token] = score
+
+        # Score phrases by IDF-weighted coverage of their tokens
+        matched_weight = defaultdict(float)
+        for vocab_token, score in similarity.items():
+            weight = self.idf[vocab_token] * score
+            for phrase_id in self.token_phrases[vocab_token]:
+                matched_weight[phrase_id] += weight
+
+        # A node scores its best phrase; ties go to the node whose other
+        # phrases also matched (e.g. "Main Quad building" -> Building 40)
+        best = {}
+        evidence = defaultdict(float)
+        for phrase_id, weight in matched_weight.items():
+            node_id, phrase, _ = self.phrases[phrase_id]
+            confidence = weight / self.phrase_weights[phrase_id] * self.phrase_scores[phrase_id]
+            evidence[node_id] += weight
+            if node_id not in best or confidence > best[node_id][0]:
+                best[node_id] = (confidence, phrase)
+
+        ranked = sorted(best, key=lambda n: (best[n][0], evidence[n]), reverse=True)
+        return [
+            ({"node_id": node_id, "confidence": round(best[node_id][0], 3), "matched": best[node_id][1]},
+             round(evidence[node_id], 6))
+            for node_id in ranked
+        ]
+
+    def resolve_best(self, text, min_confidence=0.6):
+        """
+        The best candidate if it is confident enough, else None. Nodes tied
+        with it are listed in "alternatives"; "ambiguous" is set when one of
+        them is a different place (a different name), so the best is only
+        an arbitrary pick.
+        """
+        candidates = self._rank(text)
+        if candidates and candidates[0][0]["confidence"] >= min_confidence:
+            best, best_evidence = dict(candidates[0][0]), candidates[0][1]
+            # Every other node the ranking can't tell apart from the best one
+            best["alternatives"] = [c["node_id"] for c, evidence in candidates[1:]
+                                    if c["confidence"] == best["confidence"] and evidence == best_evidence]
+            name = self.node_names.get(best["node_id"])
+            best["ambiguous"] = any(self.node_names.get(n) != name for n in best["alternatives"])
+            return best
+        return None
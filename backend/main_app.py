@@ -1,40 +1,69 @@
 import google.generativeai as genai
-import networkx as nx
 import cv2  # OpenCV
 import json
 import os
 import time
+import zlib
 import threading # For the background scanner
 import uvicorn
-from fastapi import FastAPI, HTTPException, Query, Body
+from fastapi import FastAPI, HTTPException, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from typing import List, Optional
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from typing import Dict, List, Optional
+from pydantic import BaseModel, conint, confloat
 from dotenv import load_dotenv
 import asyncio
+import concurrent.futures
 from elevenlabs.client import ElevenLabs
 from elevenlabs.conversational_ai.conversation import Conversation
 from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
+from routing import with_stale_penalties
+from alert_broadcast import AlertBroadcaster
+from voice_sessions import VoiceSessionManager, SessionLimitReached
+from event_bus import EventBus, ALL_TOPICS
+from admission import SingleFlight, AdmissionGate, StaleCache, Overloaded
+from spread_model import path_time_margin
+from scan_cycle import run_cameras, merge_observations, stale_nodes, node_ages, Deadline, OK, LATE, FAILED
+from evac_sim import population_from_crowd
+from incident_log import KINDS
+from world_store import default_store_path, acquire_scanner_lock, snapshot_to_dict, diff_snapshots
+from sites import Site, load_site_configs, DEFAULT_SITE_ID
+from fair_pool import FairExecutor
+from metrics import (REGISTRY, Gauge, BufferedLog, GET_PATH_SECONDS, SCANNER_STAGE_SECONDS,
+                     UPSTREAM_SECONDS, CACHE_REQUESTS, SCAN_CAMERAS)
 
 # Load environment variables from .env file
 load_dotenv()
 
 # --- 1. Global State & Configuration ---
 
-CURRENT_WORLD_STATE = {
-    "danger_nodes": [],
-    "crowd_data": []
-}
-STATE_LOCK = threading.Lock()
+# Each site's world state is shared between processes through a
+# memory-mapped store: exactly one process (the one holding the scanner
+# lock) runs the scanners and writes them; every API worker reads them
+# lock-free. This lets `uvicorn main_app:app --workers N` scale /get_path
+# across cores while detection runs once.
+WORLD_STATE_PATH = os.getenv("WORLD_STATE_PATH", default_store_path())  # the default site's store
+# "auto": the first process to grab the lock runs the scanner; "on"/"off" force it
+SCANNER_MODE = os.getenv("SCANNER_MODE", "auto")
 
-# Voice agent state
-VOICE_AGENT_STATE = {
-    "location": None,
-    "is_active": False,
-    "session_id": None
-}
-VOICE_LOCK = threading.Lock()
+# Everything a site's scanner decides (snapshots, VLM verdicts, route
+# changes) is appended to its binary incident log; /timeline reads
+# windows from it. Other sites' logs go next to this one.
+INCIDENT_LOG_PATH = os.getenv("INCIDENT_LOG_PATH", "incident_timeline.bin")  # the default site's log
+
+# Hot-path logging is buffered and flushed by a background thread;
+# /get_path only logs one request in every LOG_SAMPLE_EVERY.
+LOG = BufferedLog(sample_every=int(os.getenv("LOG_SAMPLE_EVERY", "20")))
+
+# Voice agent sessions (per-session state, capped and TTL-expired).
+# Session events go out on VOICE_EVENTS, one topic per session ID.
+VOICE_EVENTS = EventBus()
+VOICE_SESSIONS = VoiceSessionManager(
+    max_sessions=int(os.getenv("VOICE_MAX_SESSIONS", "500")),
+    ttl_sec=float(os.getenv("VOICE_SESSION_TTL_SEC", "300")),
+    idle_release_sec=float(os.getenv("VOICE_SESSION_IDLE_SEC", "60")),
+    on_release=VOICE_EVENTS.forget,
+)
 
 # --- CORRECTED VIDEO_SOURCES ---
 # These keys (P1, P2, etc.) MUST match your graph.json
@@ -57,36 +86,120 @@ except Exception as e:
     print(f"FATAL ERROR: Could not load graph.json: {e}")
     NODE_LIST = []
 
-# --- RECONCILED GRAPH BUILDING ---
-G = nx.Graph()
-node_lookup = {} # To quickly find node data by ID
+LOCATION_MIN_CONFIDENCE = float(os.getenv("LOCATION_MIN_CONFIDENCE", "0.6"))
+# Observations older than STALE_AFTER_SEC count as stale; routing adds
+# STALE_NODE_PENALTY to edges at stale nodes (see scan_cycle.py).
+STALE_AFTER_SEC = float(os.getenv("STALE_AFTER_SEC", "60"))
+STALE_NODE_PENALTY = float(os.getenv("STALE_NODE_PENALTY", "50"))
+# Smoke spread (see spread_model.py): routes must pass each node at least
+# SPREAD_MARGIN_SEC before the model says smoke gets there. Results depend
+# on the clock as well as the world state, so /get_path ETags roll over
+# every SPREAD_ETAG_SEC while there is a fire.
+SPREAD_MARGIN_SEC = float(os.getenv("SPREAD_MARGIN_SEC", "30"))
+SPREAD_ETAG_SEC = int(os.getenv("SPREAD_ETAG_SEC", "5"))
+SPREAD_OPTIONS = {
+    "spread_speed": float(os.getenv("SPREAD_SPEED_MPS", "0.5")),
+    "wind_coupling": float(os.getenv("SPREAD_WIND_COUPLING", "0.6")),
+}
 
-# 1. Add all the nodes from the list
-for node in NODE_LIST:
-    G.add_node(node["id"], name=node["name"], x=node["x"], y=node["y"], exit_node=node["exit_node"])
-    node_lookup[node["id"]] = node # Save for fast lookups
+# --- Sites (see sites.py) ---
+# The default site is graph.json with VIDEO_SOURCES; SITES_DIR adds more.
+# Each site gets a customizable contraction hierarchy for live search
+# (cached next to its graph, or in CCH_INDEX_PATH for the default site)
+# and precomputed evacuation trees for likely danger sets: no danger,
+# every single node, adjacent node pairs (a fire plus its downwind
+# neighbour) and any extra pairs. The default site's extra pairs come from
+# SCENARIO_PAIRS, e.g. "P1+P2,P4+P5".
+SITES_DIR = os.getenv("SITES_DIR", "sites")
+SCENARIO_PAIRS = [tuple(p.split("+")) for p in os.getenv("SCENARIO_PAIRS", "").split(",") if "+" in p]
 
-# 2. Add all the edges using the "adjacent" key
-for node in NODE_LIST:
-    u_id = node["id"]
-    u_node_data = node_lookup[u_id]
-    
-    for v_id in node["adjacent"]:
-        if v_id in node_lookup:
-            v_node_data = node_lookup[v_id]
-            dx = u_node_data["x"] - v_node_data["x"]
-            dy = u_node_data["y"] - v_node_data["y"]
-            weight = (dx**2 + dy**2)**0.5 # sqrt(dx^2 + dy^2)
-            G.add_edge(u_id, v_id, weight=weight)
+
+def build_site(site_id, config, node_list):
+    if site_id == DEFAULT_SITE_ID:
+        state_path = WORLD_STATE_PATH
+        incident_log_path = INCIDENT_LOG_PATH
+        cch_index_path = os.getenv("CCH_INDEX_PATH", "graph.cch.npz")
+    else:
+        state_path = default_store_path(f"aegis_world_state_{site_id}.bin")
+        incident_log_path = os.path.join(os.path.dirname(INCIDENT_LOG_PATH), f"incident_timeline_{site_id}.bin")
+        cch_index_path = os.path.splitext(config["graph"])[0] + ".cch.npz"
+    return Site(
+        site_id, node_list, config["cameras"], state_path, incident_log_path, cch_index_path,
+        name=config["name"],
+        wind=config["wind"],
+        scenario_pairs=config["scenario_pairs"],
+        precompute_adjacent_pairs=os.getenv("PRECOMPUTE_ADJACENT_PAIRS", "1") == "1",
+        scenario_table_bytes=int(os.getenv("SCENARIO_TABLE_MAX_MB", "64")) << 20,
+        stale_penalty=STALE_NODE_PENALTY,
+        stale_after=STALE_AFTER_SEC,
+        meters_per_unit=config["meters_per_unit"],
+        spread_margin=SPREAD_MARGIN_SEC,
+        spread_options=SPREAD_OPTIONS,
+    )
+
+
+def load_sites():
+    configs = {DEFAULT_SITE_ID: {
+        "name": DEFAULT_SITE_ID,
+        "graph": "graph.json",
+        "cameras": VIDEO_SOURCES,
+        "wind": {'speed': '15mph', 'direction': 'NW'},
+        "scenario_pairs": SCENARIO_PAIRS,
+        # graph.json coordinates are map pixels; this converts them to meters
+        "meters_per_unit": float(os.getenv("EVAC_METERS_PER_UNIT", "1.5")),
+    }}
+    try:
+        configs.update(load_site_configs(SITES_DIR))
+    except (ValueError, OSError) as e:
+        print(f"FATAL ERROR: Could not load site configs from {SITES_DIR}: {e}")
+
+    sites = {}
+    for site_id, config in configs.items():
+        if site_id == DEFAULT_SITE_ID and config["graph"] == "graph.json":
+            node_list = NODE_LIST
         else:
-            print(f"Warning: Node {u_id} lists adjacent node {v_id} which does not exist.")
+            try:
+                with open(config["graph"]) as f:
+                    node_list = json.load(f)
+            except (ValueError, OSError) as e:
+                print(f"FATAL ERROR: Could not load {config['graph']} for site '{site_id}': {e}")
+                continue
+        sites[site_id] = build_site(site_id, config, node_list)
+    return sites
+
+
+SITES = load_sites()
+DEFAULT_SITE = SITES[DEFAULT_SITE_ID]
+
+
+def get_site(site_id):
+    site = SITES.get(site_id)
+    if site is None:
+        raise HTTPException(status_code=404, detail=f"Unknown site '{site_id}'.")
+    return site
 
-print(f"Built NetworkX graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges.")
 
-# 3. Find all exit nodes at startup
-EXIT_NODES_LIST = [node["id"] for node in NODE_LIST if node.get("exit_node", False)]
-print(f"Found {len(EXIT_NODES_LIST)} exit nodes: {EXIT_NODES_LIST}")
-# --- END RECONCILED GRAPH BUILDING ---
+# One bounded pool for every site's frame decode, uploads, VLM calls and
+# TTS, shared round-robin between sites (see fair_pool.py)
+UPSTREAM_POOL = FairExecutor(max_workers=int(os.getenv("UPSTREAM_WORKERS", "8")),
+                             max_queued=int(os.getenv("UPSTREAM_MAX_QUEUED", "256")), name="upstream")
+# Longest a TTS job may take, queueing on UPSTREAM_POOL included
+ALERT_TTS_TIMEOUT_SEC = float(os.getenv("ALERT_TTS_TIMEOUT_SEC", "30"))
+
+
+def upstream_call(site_id, timeout, fn, *args):
+    """
+    Runs fn on UPSTREAM_POOL for a site and waits at most `timeout`
+    seconds, queueing included. Raises concurrent.futures.TimeoutError
+    (after cancelling the task if it hasn't started yet) or Overloaded if
+    the site's queue is full.
+    """
+    future = UPSTREAM_POOL.submit(site_id, fn, *args)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
 
 
 # Configure Gemini API
@@ -133,25 +246,29 @@ print("Gemini model configured.")
 
 # --- 3. Helper Functions (File Upload & Frame Extraction) ---
 
-def upload_file_to_gemini(path, mime_type=None):
-    """Uploads a file and WAITS for it to be 'ACTIVE'."""
-    print(f"Uploading {path}...")
-    file = genai.upload_file(path=path, mime_type=mime_type)
-    
-    timeout_seconds = 120 # 2 minute timeout
+def upload_file_to_gemini(path, mime_type=None, timeout_seconds=120):
+    """Uploads a file and WAITS (at most timeout_seconds) for it to be 'ACTIVE'."""
+    LOG.log(f"Uploading {path}...")
     start_time = time.time()
-    
-    while time.time() - start_time < timeout_seconds:
-        file = genai.get_file(file.name)
-        if file.state.name == "ACTIVE":
-            return file
-        if file.state.name == "FAILED":
-            raise ValueError(f"File {file.name} failed to process.")
-        
-        print(f"   ...state is {file.state.name}, waiting 2 seconds...")
-        time.sleep(2) 
+    outcome = "error"
+    try:
+        file = genai.upload_file(path=path, mime_type=mime_type)
         
-    raise TimeoutError(f"File {file.name} processing timed out.")
+        while time.time() - start_time < timeout_seconds:
+            file = genai.get_file(file.name)
+            if file.state.name == "ACTIVE":
+                outcome = "ok"
+                return file
+            if file.state.name == "FAILED":
+                raise ValueError(f"File {file.name} failed to process.")
+            
+            LOG.log(f"   ...state is {file.state.name}, waiting...")
+            time.sleep(min(2, max(0, timeout_seconds - (time.time() - start_time))))
+            
+        outcome = "timeout"
+        raise TimeoutError(f"File {file.name} processing timed out.")
+    finally:
+        UPSTREAM_SECONDS.observe(time.time() - start_time, service="gemini_upload", outcome=outcome)
 
 def extract_frame_as_image(video_path, frame_time_sec, output_path):
     """Extracts one frame from a video and saves it as a JPG."""
@@ -193,125 +310,229 @@ def extract_frame_as_image(video_path, frame_time_sec, output_path):
 
 # --- 4. The Background "Scanner" Thread ---
 
-def scan_cctv_loop():
+# One scanner thread per site. Every cycle has a hard deadline; each
+# camera's extract + upload has its own timeout within it, and runs on the
+# shared UPSTREAM_POOL. Late or failed cameras keep their last status and
+# age (see scan_cycle.py).
+SCAN_CYCLE_DEADLINE_SEC = float(os.getenv("SCAN_CYCLE_DEADLINE_SEC", "30"))
+SCAN_CAMERA_TIMEOUT_SEC = float(os.getenv("SCAN_CAMERA_TIMEOUT_SEC", "15"))
+
+
+def scan_camera(job):
+    """Extracts and uploads one camera's frame; runs on UPSTREAM_POOL."""
+    try:
+        stage_start = time.perf_counter()
+        if not extract_frame_as_image(job["source_video"], job["frame_time"], job["path"]):
+            raise ValueError(f"Could not extract a frame from {job['source_video']}")
+        SCANNER_STAGE_SECONDS.observe(time.perf_counter() - stage_start, stage="extract")
+
+        stage_start = time.perf_counter()
+        gemini_file = upload_file_to_gemini(job["path"], mime_type="image/jpeg", timeout_seconds=job["timeout"])
+        SCANNER_STAGE_SECONDS.observe(time.perf_counter() - stage_start, stage="upload")
+        return gemini_file
+    except Exception:
+        discard_camera_frame(job, None)
+        raise
+
+
+def discard_camera_frame(job, gemini_file):
+    """Deletes a camera's uploaded file and temp frame."""
+    if gemini_file is not None:
+        try:
+            genai.delete_file(gemini_file.name)
+        except Exception as e:
+            LOG.log(f"Warning: Could not delete file {gemini_file.name}. Error: {e}")
+    if os.path.exists(job["path"]):
+        os.remove(job["path"])
+
+
+def analyse_frames(node_list, gemini_files, timeout_seconds):
     """
-    This is the "Scanner" thread. It runs forever in the background.
+    One VLM call over a site's frames. Returns (danger_nodes, crowd_data,
+    vlm_seconds). Detection only: spread is predicted locally (spread_model.py).
     """
-    current_time_sec = 0
-    print("\n*** Background Scanner Thread STARTED ***\n")
+    # --- THIS IS THE CORRECTED PROMPT ---
+    prompt_parts = [
+        f"You are a *cautious* and *methodical* AI Incident Commander.",
+        f"Your job is to analyze *snapshot images* from CCTV feeds one by one with a high degree of precision.",
+        f"Here is the static map's layout (node list): {json.dumps(node_list)}", # <-- This is the fix
+        "\n--- IMAGE FEEDS ---"
+    ]
+    for node_id, gemini_file in gemini_files.items():
+        prompt_parts.append(f"\nThis *snapshot image* is from node: '{node_id}'")
+        prompt_parts.append(gemini_file)
+
+    prompt_parts.append(
+        """
+        Analyze this data with extreme caution.
+        
+        **CRITICAL INSTRUCTIONS:**
+        1.  **Analyze EACH image feed INDIVIDUALLY.**
+        2.  **DEMAND HIGH CONFIDENCE.** Only flag *unambiguous, clear evidence* of "fire" or "dense smoke".
+        3.  **NEGATIVE PROMPTING:** Do NOT flag steam, dust, fog, sunsets, or red cars.
+        
+        **YOUR TASK:**
+        1.  **First, (in your mind) review each image one-by-one:**
+            * Does the image for 'P1' show fire/smoke?
+            * ...and so on for all other nodes.
+        2.  **Second,** identify which node(s) (if any) are the source of the fire.
+        3.  **Third,** identify which node(s) (if any) show 'large crowds' (10+ people).
+        4.  **Finally,** call the `report_incident_details` function with:
+            a) a list of nodes where the image *currently* shows fire or dense smoke. Do NOT guess where it will spread.
+            b) a list of all nodes where you see large crowds.
+        """
+    )
     
-    global_wind = {'speed': '15mph', 'direction': 'NW'}
+    stage_start = time.perf_counter()
+    vlm_outcome = "error"
+    try:
+        chat = gemini_model.start_chat(enable_automatic_function_calling=True)
+        response = chat.send_message(prompt_parts, request_options={"timeout": timeout_seconds})
+        vlm_outcome = "ok"
+    finally:
+        vlm_seconds = time.perf_counter() - stage_start
+        SCANNER_STAGE_SECONDS.observe(vlm_seconds, stage="vlm")
+        UPSTREAM_SECONDS.observe(vlm_seconds, service="gemini_vlm", outcome=vlm_outcome)
+
+    function_call = response.candidates[0].content.parts[0].function_call
+    if function_call.name != "report_incident_details":
+        raise ValueError(f"VLM did not report incident details (got '{function_call.name}')")
+    args = function_call.args
+    # Plain JSON-friendly values for the shared store
+    danger_nodes = [str(node) for node in args.get("danger_nodes", [])]
+    crowd_data = [{"node_id": str(c.get("node_id")), "people_count": c.get("people_count", 0)}
+                  for c in args.get("crowd_nodes", [])]
+    return danger_nodes, crowd_data, vlm_seconds
+
+
+def publish_scan(site, verdict, cameras, vlm_seconds):
+    """Merges this cycle's (possibly partial) results into the site's world state and publishes it."""
+    stage_start = time.perf_counter()
+    previous = site.world_state.read()
+    now = time.time()
+    new_state = merge_observations(snapshot_to_dict(previous), verdict, cameras, now,
+                                   heartbeat=site.world_state.heartbeat())
+    new_state["stale_nodes"] = stale_nodes(new_state, now, STALE_AFTER_SEC)
+
+    routing_changed = (previous.danger_nodes != tuple(new_state["danger_nodes"])
+                       or [dict(c) for c in previous.crowd_data] != new_state["crowd_data"]
+                       or previous.stale_nodes != tuple(new_state["stale_nodes"]))
+    state_changed = routing_changed or dict(previous.cameras) != new_state["cameras"]
+    if state_changed:
+        # New immutable snapshot, new version
+        version = site.world_state_writer.publish(new_state)
+    elif verdict is not None:
+        # Same state re-confirmed: keep the version (and clients' ETags)
+        site.world_state_writer.touch()
+
+    # Pre-generate every zone's announcement and route table for the new state
+    if routing_changed:
+        crowd = with_stale_penalties(new_state["crowd_data"], new_state["stale_nodes"], site.stale_penalty)
+        site.alert_broadcaster.submit(new_state["danger_nodes"], crowd)
+        site.scenario_routes.submit(crowd)
+    SCANNER_STAGE_SECONDS.observe(time.perf_counter() - stage_start, stage="publish")
+
+    # Timeline recording never holds up publishing
+    try:
+        site.incident_recorder.record_verdict({
+            "cameras": cameras,
+            "danger_nodes": verdict[0] if verdict else None,
+            "crowd_data": verdict[1] if verdict else None,
+            "vlm_seconds": round(vlm_seconds, 3) if vlm_seconds is not None else None,
+        })
+        if state_changed:
+            site.incident_recorder.record_snapshot(version, new_state)
+    except OSError as e:
+        LOG.log(f"--- SCANNER [{site.site_id}]: Could not write incident log: {e} ---")
+    return new_state
+
+
+def scan_cctv_loop(site):
+    """
+    This is a site's "Scanner" thread. It runs forever in the background.
+    """
+    current_time_sec = 0
+    tag = f"SCANNER [{site.site_id}]"
+    upstream = UPSTREAM_POOL.for_tenant(site.site_id)
+    print(f"\n*** Background Scanner Thread STARTED for site '{site.site_id}' ***\n")
     
     while True:
-        print(f"\n--- SCANNER (Time: {current_time_sec}s): Starting new scan... ---")
-        
-        snapshot_jobs = [
-            {"node_id": "P1", "source_video": VIDEO_SOURCES["P1"]},
-            {"node_id": "P2", "source_video": VIDEO_SOURCES["P2"]},
-            {"node_id": "P4", "source_video": VIDEO_SOURCES["P4"]},
-            {"node_id": "P5", "source_video": VIDEO_SOURCES["P5"]},
-            {"node_id": "P14", "source_video": VIDEO_SOURCES["P14"]},
-        ]
-
-        # 2. Extract a frame from each video
-        temp_image_files = []
-        for i, job in enumerate(snapshot_jobs):
-            if job["node_id"] not in VIDEO_SOURCES:
-                print(f"Warning: Node {job['node_id']} not in VIDEO_SOURCES dict. Skipping.")
-                continue
-            if not os.path.exists(job["source_video"]):
-                print(f"Warning: Video file not found at {job['source_video']}. Skipping node {job['node_id']}.")
+        LOG.log(f"--- {tag} (Time: {current_time_sec}s): Starting new scan... ---")
+        cycle_start = time.perf_counter()
+        deadline = Deadline(SCAN_CYCLE_DEADLINE_SEC)
+
+        # 2. Extract and upload a frame from each camera, all cameras in parallel
+        camera_timeout = min(SCAN_CAMERA_TIMEOUT_SEC, deadline.remaining())
+        cameras, runnable = {}, []
+        for node_id, source_video in site.cameras.items():
+            if not os.path.exists(source_video):
+                LOG.log(f"Warning: Video file not found at {source_video}. Skipping node {node_id}.")
+                cameras[node_id] = FAILED
                 continue
-            
-            # Use current_time_sec directly - extract_frame_as_image will handle capping to video duration
-            frame_time = current_time_sec
-            temp_path = f"./temp_frame_{i}.jpg"
-            success = extract_frame_as_image(job["source_video"], frame_time, temp_path)
-            if success:
-                temp_image_files.append({"node_id": job["node_id"], "path": temp_path})
-
-        # 3. Call Gemini (VLM) with all frames
-        gemini_files_to_delete = []
-        if not temp_image_files:
-            print("--- SCANNER: No images extracted. Skipping Gemini call. ---")
-            current_time_sec += 5
-            time.sleep(5) 
-            continue 
+            # extract_frame_as_image caps current_time_sec to the video duration
+            runnable.append({"node_id": node_id, "source_video": source_video,
+                             "frame_time": current_time_sec, "timeout": camera_timeout,
+                             "path": f"./temp_frame_{site.site_id}_{current_time_sec}_{node_id}.jpg"})
+        results = run_cameras(upstream, runnable, scan_camera, camera_timeout, on_late=discard_camera_frame)
+        jobs_by_node = {job["node_id"]: job for job in runnable}
+        uploaded = {}
+        for node_id, (status, result) in results.items():
+            cameras[node_id] = status
+            if status == OK:
+                uploaded[node_id] = result
+            elif status == FAILED:
+                LOG.log(f"--- {tag}: Camera {node_id} failed: {result} ---")
 
+        # 3. Call Gemini (VLM) with the frames that made it, within what's left of the deadline.
+        # Waiting for a pool worker counts against the deadline too.
+        verdict, vlm_seconds, vlm_future = None, None, None
         try:
-            # --- THIS IS THE CORRECTED PROMPT ---
-            prompt_parts = [
-                f"You are a *cautious* and *methodical* AI Incident Commander.",
-                f"Your job is to analyze *snapshot images* from CCTV feeds one by one with a high degree of precision.",
-                f"Here is the static map's layout (node list): {json.dumps(NODE_LIST)}", # <-- This is the fix
-                f"Here is the current wind data: {json.dumps(global_wind)}",
-                "\n--- IMAGE FEEDS ---"
-            ]
-            
-            for img_info in temp_image_files:
-                gemini_file = upload_file_to_gemini(img_info["path"], mime_type="image/jpeg")
-                gemini_files_to_delete.append(gemini_file)
-                prompt_parts.append(f"\nThis *snapshot image* is from node: '{img_info['node_id']}'")
-                prompt_parts.append(gemini_file) 
-
-            prompt_parts.append(
-                """
-                Analyze this data with extreme caution.
-                
-                **CRITICAL INSTRUCTIONS:**
-                1.  **Analyze EACH image feed INDIVIDUALLY.**
-                2.  **DEMAND HIGH CONFIDENCE.** Only flag *unambiguous, clear evidence* of "fire" or "dense smoke".
-                3.  **NEGATIVE PROMPTING:** Do NOT flag steam, dust, fog, sunsets, or red cars.
-                
-                **YOUR TASK:**
-                1.  **First, (in your mind) review each image one-by-one:**
-                    * Does the image for 'P1' show fire/smoke?
-                    * ...and so on for all other nodes.
-                2.  **Second,** identify which node(s) (if any) are the source of the fire.
-                3.  **Third,** identify which node(s) (if any) show 'large crowds' (10+ people).
-                4.  **Fourth,** based on the wind and the fire location, predict the smoke's spread.
-                5.  **Finally,** call the `report_incident_details` function with:
-                    a) a list of nodes that are *currently* on fire OR in the *direct path* of the predicted danger zone.
-                    b) a list of all nodes where you see large crowds.
-                """
-            )
-            
-            chat = gemini_model.start_chat(enable_automatic_function_calling=True)
-            response = chat.send_message(prompt_parts)
-            
-            function_call = response.candidates[0].content.parts[0].function_call
-            if function_call.name == "report_incident_details":
-                args = function_call.args
-                new_danger_nodes = list(args.get("danger_nodes", []))
-                new_crowd_data = list(args.get("crowd_nodes", []))
-                
-                with STATE_LOCK:
-                    CURRENT_WORLD_STATE["danger_nodes"] = new_danger_nodes
-                    CURRENT_WORLD_STATE["crowd_data"] = new_crowd_data
-                
-                print(f"--- SCANNER: State Updated! ---")
-                print(f"   Danger Nodes: {new_danger_nodes}")
-                print(f"   Crowd Data: {new_crowd_data}")
-
+            if uploaded and deadline.remaining() >= 1:
+                vlm_future = upstream.submit(analyse_frames, site.node_list, uploaded, deadline.remaining())
+                danger_nodes, crowd_data, vlm_seconds = vlm_future.result(timeout=deadline.remaining())
+                verdict = (danger_nodes, crowd_data)
+            elif uploaded:
+                cameras.update({node_id: LATE for node_id in uploaded})
+        except concurrent.futures.TimeoutError:
+            cameras.update({node_id: LATE for node_id in uploaded})
+            LOG.log(f"--- {tag}: VLM call missed the cycle deadline ---")
         except Exception as e:
+            cameras.update({node_id: FAILED for node_id in uploaded})
             # --- MAKE THIS LOUDER ---
             print("\n" + "="*50)
-            print(f"--- SCANNER: FATAL ERROR IN GEMINI CALL ---")
+            print(f"--- {tag}: FATAL ERROR IN GEMINI CALL ---")
             print(f"DETAILS: {e}")
             print("="*50 + "\n")
             # --- END OF LOUD ERROR ---
         finally:
-            for file in gemini_files_to_delete:
-                try:
-                    genai.delete_file(file.name)
-                except Exception as e:
-                    print(f"Warning: Could not delete file {file.name}. Error: {e}")
-            for img in temp_image_files:
-                if os.path.exists(img["path"]):
-                    os.remove(img["path"])
+            def discard_uploads(_=None, uploaded=uploaded, jobs=jobs_by_node):
+                for node_id, gemini_file in uploaded.items():
+                    discard_camera_frame(jobs[node_id], gemini_file)
+            if vlm_future is not None and not vlm_future.cancel() and not vlm_future.done():
+                vlm_future.add_done_callback(discard_uploads)  # still reading the files
+            else:
+                discard_uploads()
+
+        # 4. Publish whatever this cycle produced; unanalysed cameras keep their last status
+        for status in cameras.values():
+            SCAN_CAMERAS.inc(status=status)
+        if cameras:
+            try:
+                new_state = publish_scan(site, verdict, cameras, vlm_seconds)
+                LOG.log(f"--- {tag}: State Updated! ---")
+                LOG.log(f"   Cameras: {cameras}")
+                LOG.log(f"   Danger Nodes: {new_state['danger_nodes']}")
+                LOG.log(f"   Crowd Data: {new_state['crowd_data']}")
+                if new_state["stale_nodes"]:
+                    LOG.log(f"   Stale Nodes: {new_state['stale_nodes']}")
+            except Exception as e:
+                print(f"--- {tag}: ERROR publishing world state: {e} ---")
+        else:
+            LOG.log(f"--- {tag}: No cameras configured. Skipping Gemini call. ---")
             
+        SCANNER_STAGE_SECONDS.observe(time.perf_counter() - cycle_start, stage="cycle")
         current_time_sec += 5
-        print(f"--- SCANNER: Loop finished. Waiting 5 seconds... ---")
+        LOG.log(f"--- {tag}: Loop finished. Waiting 5 seconds... ---")
         time.sleep(5) 
 
 # --- 5. FastAPI App & Startup Event ---
@@ -326,9 +547,30 @@ async def lifespan(app: FastAPI):
     # This code runs ON STARTUP
     print("Application startup...")
     # Start the background "Scanner" thread
-    scanner_thread = threading.Thread(target=scan_cctv_loop, daemon=True)
-    scanner_thread.start()
+    LOG.start()
+    scanner_lock = None
+    if SCANNER_MODE == "auto":
+        scanner_lock = acquire_scanner_lock(WORLD_STATE_PATH + ".lock")
+    if SCANNER_MODE == "on" or scanner_lock:
+        for site in SITES.values():
+            site.start_scanning()
+            scanner_thread = threading.Thread(target=scan_cctv_loop, args=(site,), daemon=True,
+                                              name=f"scanner-{site.site_id}")
+            scanner_thread.start()
+            site.alert_broadcaster.start()
+            print(f"Process {os.getpid()} is the scanner for site '{site.site_id}'; "
+                  f"publishing world state to {site.state_path}")
+    else:
+        print(f"Process {os.getpid()} is an API worker for sites {sorted(SITES)}")
+    for site in SITES.values():
+        site.scenario_routes.start()  # every worker serves /get_path from its own tables
+    reaper_task = asyncio.create_task(VOICE_SESSIONS.run_reaper())
     yield
+    reaper_task.cancel()
+    if scanner_lock:
+        scanner_lock.close()
+    for site in SITES.values():
+        site.close()
     # This code runs ON SHUTDOWN (we don't need anything here)
     print("Application shutdown.")
 
@@ -347,106 +589,224 @@ app.add_middleware(
 
 # --- 6. The API Endpoint for the Frontend ---
 
+def path_etag(site_id, version, start_node, affected_nodes, spread_window=None, stale_nodes=()):
+    """
+    ETag for a /get_path answer: site and world-state version plus the
+    query, the nodes gone stale since (and the spread window).
+    """
+    query_hash = zlib.crc32("|".join([site_id, start_node] + sorted(affected_nodes) + ["~"] + list(stale_nodes))
+                            .encode("utf-8"))
+    if spread_window is not None:
+        return f'"ws{version}-{query_hash:08x}-t{spread_window}"'
+    return f'"ws{version}-{query_hash:08x}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+# Stampede protection for /get_path: identical concurrent queries share
+# one computation, at most GET_PATH_MAX_IN_FLIGHT run at once on their own
+# threads, and at most GET_PATH_MAX_QUEUE wait. Beyond that a request gets
+# its last good answer (if still clear of danger) or a fast 503.
+PATH_FLIGHTS = SingleFlight()
+PATH_GATE = AdmissionGate(
+    max_in_flight=int(os.getenv("GET_PATH_MAX_IN_FLIGHT", "8")),
+    max_queue=int(os.getenv("GET_PATH_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("GET_PATH_QUEUE_TIMEOUT_SEC", "2")),
+    name="get-path",
+)
+STALE_PATHS = StaleCache(maxsize=4096)
+
+
+def compute_safe_path(site, snapshot, start_node, affected_nodes, stale_nodes=None):
+    """The routing work behind /get_path; runs on PATH_GATE's threads."""
+    danger_nodes = list(snapshot.danger_nodes)
+    crowd_data = site.routing_crowd(snapshot, stale_nodes)
+
+    # Merge affected_nodes from frontend with current world state
+    # (union, no duplicates)
+    if affected_nodes:
+        danger_nodes = list(set(danger_nodes) | set(affected_nodes))
+
+    if not site.G.has_node(start_node) or start_node in danger_nodes:
+        raise HTTPException(status_code=404, detail=f"Start node '{start_node}' is blocked or invalid.")
+
+    # Table lookup when this danger set was precomputed, live search otherwise
+    source = "precomputed"
+    precomputed = site.scenario_routes.lookup(start_node, danger_nodes, crowd_data)
+    if precomputed is None:
+        site.scenario_routes.submit(crowd_data)  # no-op unless the crowd state is new
+        shortest_path, min_length, source = site.live_search(start_node, danger_nodes, crowd_data)
+    else:
+        shortest_path, min_length = precomputed
+
+    if not shortest_path:
+        raise HTTPException(status_code=404, detail="No safe path found.")
+
+    # Don't send anyone through a place the smoke will reach first
+    margin = None
+    if danger_nodes:
+        unsafe_at = site.unsafe_at(danger_nodes, snapshot.danger_since)
+        shortest_path, min_length, margin, rerouted = site.avoid_spread(
+            start_node, shortest_path, min_length, danger_nodes, crowd_data, unsafe_at)
+        if rerouted:
+            source = "time_aware"
+
+    return {"path": shortest_path, "cost": min_length, "live_danger_nodes": danger_nodes,
+            "world_state_version": snapshot.version, "source": source,
+            # Seconds to spare at the tightest node; None if the smoke reaches nothing on the path
+            "time_margin_seconds": round(margin, 1) if margin is not None and margin != float("inf") else None,
+            # False: no route keeps SPREAD_MARGIN_SEC, this one has the most slack there is (best effort)
+            "time_safe": margin is None or margin >= site.spread_margin}
+
+
 @app.get("/get_path")
-def get_safe_path(
+async def get_safe_path(
+    response: Response,
     start_node: str = Query(..., description="The starting node ID for pathfinding"),
-    affected_nodes: List[str] = Query(default=[], description="List of affected nodes from previous Gemini analysis")
+    affected_nodes: List[str] = Query(default=[], description="List of affected nodes from previous Gemini analysis"),
+    site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use"),
+    if_none_match: Optional[str] = Header(default=None)
 ):
     """
     Finds the safest, lowest-cost path from a start_node to the
     nearest *auto-detected* exit_node, using the *live* world state.
     If affected_nodes are provided, they are merged with the current world state.
+    The response carries the world-state version as an ETag; a matching
+    If-None-Match gets a 304 without recomputing the path.
+    Under overload the answer may be stale (marked with a Warning header
+    and "stale": true) or a 503 with Retry-After.
     """
     
-    with STATE_LOCK:
-        danger_nodes = list(CURRENT_WORLD_STATE["danger_nodes"])
-        crowd_data = list(CURRENT_WORLD_STATE["crowd_data"])
-    
-    # Merge affected_nodes from frontend with current world state
-    # Use affected_nodes if provided, otherwise use world state
-    if affected_nodes:
-        # Combine affected_nodes with current danger_nodes (union, no duplicates)
-        combined_danger_nodes = list(set(danger_nodes + affected_nodes))
-        print(f"\n--- API CALL: /get_path ---")
-        print(f"   Start: {start_node}")
-        print(f"   Affected Nodes (from frontend): {affected_nodes}")
-        print(f"   Current World State Danger Nodes: {danger_nodes}")
-        print(f"   Combined Danger Nodes: {combined_danger_nodes}")
-        print(f"   Live Crowd Data: {crowd_data}")
-        danger_nodes = combined_danger_nodes
-    else:
-        print(f"\n--- API CALL: /get_path ---")
-        print(f"   Start: {start_node}")
-        print(f"   Live Danger Nodes: {danger_nodes}")
-        print(f"   Live Crowd Data: {crowd_data}")
-
-    G_copy = G.copy()
-    
-    for node in danger_nodes:
-        if G_copy.has_node(node):
-            G_copy.remove_node(node)
-            print(f"   REMOVING: {node}")
-        else:
-            print(f"   Warning: Danger node {node} not in graph.")
-            
-    for crowd_info in crowd_data:
-        node_id = crowd_info.get("node_id")
-        penalty = crowd_info.get("people_count", 0)
-        
-        if G_copy.has_node(node_id):
-            for neighbor in list(G_copy.neighbors(node_id)): 
-                try:
-                    edge = G_copy[node_id][neighbor]
-                    edge['weight'] = edge.get('weight', 1) + penalty
-                    print(f"   PENALTY: +{penalty} to edges near {node_id}")
-                except KeyError:
-                    print(f"   Skipping penalty for edge {node_id}-{neighbor} (neighbor removed).")
-        else:
-            print(f"   Warning: Crowd node {node_id} not in graph.")
+    started = time.perf_counter()
+    outcome = "not_found"
+    result = None
+    try:
+        site = get_site(site_id)
+        snapshot = site.world_state.read()
+        spread_window = int(time.time() // SPREAD_ETAG_SEC) if snapshot.danger_nodes or affected_nodes else None
+        stale_nodes = site.stale_nodes(snapshot)
+        etag = path_etag(site_id, snapshot.version, start_node, affected_nodes, spread_window, stale_nodes)
+        if etag_matches(if_none_match, etag):
+            outcome = "not_modified"
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
-    # --- A* Heuristic Function ---
-    def astar_heuristic(u, v):
+        query = (site_id, start_node, frozenset(affected_nodes))
         try:
-            node_u = G.nodes[u]
-            node_v = G.nodes[v]
-            dx = node_u['x'] - node_v['x']
-            dy = node_u['y'] - node_v['y']
-            return (dx**2 + dy**2)**0.5 # Euclidean distance
-        except KeyError:
-            return 0 
-
-    shortest_path = None
-    min_length = float('inf')
-    
-    if not G_copy.has_node(start_node):
-        raise HTTPException(status_code=404, detail=f"Start node '{start_node}' is blocked or invalid.")
+            result, shared = await PATH_FLIGHTS.run(
+                (snapshot.version, spread_window, stale_nodes) + query,
+                lambda: PATH_GATE.run(compute_safe_path, site, snapshot, start_node, affected_nodes, stale_nodes))
+        except Overloaded:
+            stale = STALE_PATHS.get(query)
+            live_danger = set(snapshot.danger_nodes) | set(affected_nodes)
+            # Never hand out an old path that now runs through danger or ahead of the smoke
+            if stale is None or live_danger & set(stale[1]["path"]) or (live_danger and path_time_margin(
+                    site.G, stale[1]["path"], site.unsafe_at(live_danger, snapshot.danger_since),
+                    site.meters_per_unit, site.walk_speed) < site.spread_margin):
+                outcome = "rejected"
+                raise HTTPException(status_code=503, detail="Server is saturated, retry shortly.",
+                                    headers={"Retry-After": "1"})
+            outcome = "stale"
+            result = stale[1]
+            response.headers["Warning"] = '110 - "Response is Stale"'
+            response.headers["Cache-Control"] = "no-store"
+            return dict(result, stale=True, stale_age_seconds=round(time.time() - stale[0], 3))
+
+        outcome = "coalesced" if shared else "ok"
+        if not shared:
+            STALE_PATHS.put(query, result)
+        # no-cache: browsers keep the body but revalidate with If-None-Match
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+        return result
+    finally:
+        GET_PATH_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        LOG.sampled(
+            f"--- API CALL: /get_path --- Site: {site_id} Start: {start_node} Affected: {affected_nodes}",
+            f"   Result: {outcome} {result['path'] if result else ''}"
+        )
+
+
+@app.get("/world_state")
+def get_world_state(
+    response: Response,
+    since: Optional[int] = Query(default=None, description="Return only what changed since this version"),
+    site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    The current world-state version and, with `since`, the delta from that
+    version. Falls back to the full state if `since` is too old.
+    Both include node_age_seconds: how long ago each node was last observed.
+    """
+    site = get_site(site_id)
+    snapshot = site.world_state.read()
+    etag = f'"{site_id}-ws{snapshot.version}"'
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    base = None
+    if since == snapshot.version:
+        base = snapshot  # nothing changed: empty delta
+    elif since is not None:
+        base = site.world_state.find_version(since)
+    # Ages move on between versions; clients can also derive them from observed_at
+    ages = node_ages(snapshot, site.world_state.heartbeat(), time.time())
+    if base is not None:
+        return dict(diff_snapshots(base, snapshot), node_age_seconds=ages)
+    return dict(snapshot_to_dict(snapshot), since=since, full=True, node_age_seconds=ages)
 
-    # Use the globally defined EXIT_NODES_LIST
-    for exit_node in EXIT_NODES_LIST: 
-        if not G_copy.has_node(exit_node):
-            print(f"   Skipping exit {exit_node}, as it's blocked or invalid.")
-            continue 
-        
-        try:
-            path = nx.astar_path(G_copy, start_node, exit_node, 
-                                 heuristic=astar_heuristic, weight='weight')
-            length = nx.astar_path_length(G_copy, start_node, exit_node, 
-                                        heuristic=astar_heuristic, weight='weight')
-            
-            if length < min_length:
-                min_length = length
-                shortest_path = path
-                
-        except nx.NetworkXNoPath:
-            print(f"   No path from {start_node} to {exit_node}.")
-            continue
-            
-    if shortest_path:
-        print(f"   PATH FOUND: {shortest_path} (Cost: {min_length})")
-        return {"path": shortest_path, "cost": min_length, "live_danger_nodes": danger_nodes}
-    else:
-        print(f"   NO PATH FOUND from {start_node} to any valid exit.")
-        raise HTTPException(status_code=404, detail="No safe path found.")
+
+@app.get("/timeline")
+def get_timeline(
+    start: Optional[float] = Query(default=None, description="Unix time; defaults to the start of the log"),
+    end: Optional[float] = Query(default=None, description="Unix time; defaults to now"),
+    kinds: List[str] = Query(default=[], description="Any of snapshot, verdict, route"),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use")
+):
+    """
+    Recorded incident events in [start, end], oldest first. Uses the log's
+    time index, so any window loads without scanning the whole log.
+    """
+    unknown = [k for k in kinds if k not in KINDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event kinds: {unknown}")
+
+    site = get_site(site_id)
+    records = list(site.incident_log.read(start, end, kinds=kinds or None, limit=limit + 1))
+    log_start, log_end = site.incident_log.bounds()
+    return {
+        "start": start,
+        "end": end,
+        "log_start": log_start,
+        "log_end": log_end,
+        "truncated": len(records) > limit,
+        "events": [dict(payload, t=t, kind=kind) for t, kind, payload in records[:limit]],
+    }
+
+
+@app.get("/spread")
+def get_spread(site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use")):
+    """Seconds until smoke from the current fires reaches each node (None: never), per the local spread model."""
+    site = get_site(site_id)
+    snapshot = site.world_state.read()
+    started = time.perf_counter()
+    unsafe_at = site.unsafe_at(snapshot.danger_nodes, snapshot.danger_since)
+    return {
+        "world_state_version": snapshot.version,
+        "fires": list(snapshot.danger_nodes),
+        "danger_since": dict(snapshot.danger_since),
+        "wind": site.wind,
+        "unsafe_in_seconds": {node: (None if t == float("inf") else round(t, 1)) for node, t in unsafe_at.items()},
+        "compute_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
 
 
 # --- 7.5. Eleven Labs Alert Audio Generation ---
@@ -455,147 +815,142 @@ class AlertAudioRequest(BaseModel):
     danger_nodes: List[str]
     escape_path: List[str]
     start_node: Optional[str] = None
+    site_id: str = DEFAULT_SITE_ID
 
-@app.post("/generate_alert_audio")
-async def generate_alert_audio(request: AlertAudioRequest):
+ALERT_VOICE_ID = None  # Resolved once, then reused for every clip
+ALERT_VOICE_LOCK = threading.Lock()
+ELEVENLABS_CLIENT = None  # One shared client for TTS and every voice session
+
+
+def get_elevenlabs_client():
+    global ELEVENLABS_CLIENT
+    if ELEVENLABS_CLIENT is None:
+        ELEVENLABS_CLIENT = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY", "sk_a630bc671f2500c1cf7a882d7d249a83d6b9bd424f93742f"))
+    return ELEVENLABS_CLIENT
+
+
+def build_alert_segments(danger_nodes, escape_path, node_names=None, shared_from=None):
     """
-    Generate audio alert using Eleven Labs agent with danger nodes and escape path information.
-    Returns audio stream that can be played on frontend.
+    The announcement for a danger set and route, as segments that can be
+    synthesized separately. With shared_from, the route is split at that
+    node so the part from there on can be shared with other zones' clips.
     """
-    try:
-        # Extract data from request
-        danger_nodes = request.danger_nodes
-        escape_path = request.escape_path
-        start_node = request.start_node
-        
-        # Get Eleven Labs client
-        client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY", "sk_a630bc671f2500c1cf7a882d7d249a83d6b9bd424f93742f"))
+    # Node names read better than IDs
+    node_names = node_names or {}
+    danger_names = [node_names.get(node, node) for node in danger_nodes]
+    path_names = [node_names.get(node, node) for node in escape_path]
+
+    if danger_names:
+        danger_str = ", ".join(danger_names)
+    else:
+        danger_str = "no areas"
+
+    header = f"Emergency Alert. Fire has been detected in the following areas: {danger_str}. Please evacuate immediately."
+    footer = "Stay calm, do not run, and follow the marked evacuation path. Do not use elevators. Proceed to the nearest exit."
+    if not path_names:
+        route = ["Follow this evacuation route: no evacuation route available."]
+    elif shared_from is None:
+        route = [f"Follow this evacuation route: {' to '.join(path_names)}."]
+    else:
+        lead = path_names[:shared_from + 1]
+        route = [f"Follow this evacuation route: {' to '.join(lead)}." if len(lead) > 1
+                 else "Follow this evacuation route.",
+                 f"From {path_names[shared_from]}, continue to {' to '.join(path_names[shared_from + 1:])}."]
+    return [header] + route + [footer]
+
+
+def build_alert_message(danger_nodes, escape_path, node_names=None):
+    """Creates the natural-language announcement for a danger set and route."""
+    return " ".join(build_alert_segments(danger_nodes, escape_path, node_names))
+
+
+def resolve_alert_voice_id(client):
+    """Uses the agent's voice if it has one, else the first available voice."""
+    global ALERT_VOICE_ID
+    with ALERT_VOICE_LOCK:
+        if ALERT_VOICE_ID:
+            CACHE_REQUESTS.inc(cache="alert_voice_id", result="hit")
+            return ALERT_VOICE_ID
+        CACHE_REQUESTS.inc(cache="alert_voice_id", result="miss")
+
         agent_id = os.getenv("ELEVENLABS_AGENT_ID", "agent_4701k9k3jegye7armnes8xvznfsb")
-        
-        # Format the alert message
-        danger_nodes_str = ", ".join(danger_nodes) if danger_nodes else "none detected"
-        path_str = " -> ".join(escape_path) if escape_path else "no path available"
-        
-        # Create a natural language alert message
-        alert_message = f"""
-        Emergency Alert: Fire detected in the following areas: {danger_nodes_str}.
-        Please evacuate immediately using the following route: {path_str}.
-        Stay calm and follow the evacuation path. Do not use elevators.
-        """
-        
-        # Get node names for better readability
-        node_names = {}
-        for node in NODE_LIST:
-            node_names[node["id"]] = node.get("name", node["id"])
-        
-        # Format with node names if available
-        danger_names = [node_names.get(node, node) for node in danger_nodes]
-        path_names = [node_names.get(node, node) for node in escape_path]
-        
-        if danger_names:
-            danger_str = ", ".join(danger_names)
-        else:
-            danger_str = "no areas"
-            
-        if path_names:
-            path_str_formatted = " to ".join(path_names)
-        else:
-            path_str_formatted = "no evacuation route available"
-        
-        # Create a more natural alert message
-        alert_message = f"Emergency Alert. Fire has been detected in the following areas: {danger_str}. Please evacuate immediately. Follow this evacuation route: {path_str_formatted}. Stay calm, do not run, and follow the marked evacuation path. Do not use elevators. Proceed to the nearest exit."
-        
-        print(f"\n--- GENERATING ALERT AUDIO ---")
-        print(f"   Danger Nodes: {danger_nodes}")
-        print(f"   Escape Path: {escape_path}")
-        print(f"   Message: {alert_message[:100]}...")
-        
-        # Use Eleven Labs text-to-speech API
-        # For agents, we need to get the agent's voice ID or use the agent's conversational API
-        # Let's try using the agent's conversational API to send a message and get audio
-        
-        # Alternative: Use text-to-speech with agent's voice
-        # First, let's try to get the agent info to find its voice ID
+        voice_id = None
         try:
-            # Get agent details
             agent_info = client.agents.get(agent_id=agent_id)
-            voice_id = None
-            
-            # Try to get voice ID from agent
             if hasattr(agent_info, 'voice_id'):
                 voice_id = agent_info.voice_id
             elif hasattr(agent_info, 'voice') and hasattr(agent_info.voice, 'voice_id'):
                 voice_id = agent_info.voice.voice_id
-            
-            # If we have a voice ID, use text-to-speech API
-            if voice_id:
-                print(f"   Using agent voice ID: {voice_id}")
-                audio_generator = client.text_to_speech.convert(
-                    voice_id=voice_id,
-                    text=alert_message,
-                    model_id="eleven_multilingual_v2",
-                    output_format="mp3_44100_128"
-                )
-                
-                # Collect audio chunks
-                audio_data = b""
-                for chunk in audio_generator:
-                    audio_data += chunk
-                
-                # Return audio as streaming response
-                return StreamingResponse(
-                    iter([audio_data]),
-                    media_type="audio/mpeg",
-                    headers={
-                        "Content-Disposition": "inline; filename=alert.mp3",
-                        "Content-Length": str(len(audio_data))
-                    }
-                )
         except Exception as e:
             print(f"   Error getting agent voice ID: {e}")
-            print(f"   Falling back to conversational API approach...")
-        
-        # Fallback: Use conversational API approach
-        # This is more complex but works with agents directly
-        # For now, let's use a default voice or the agent's default voice
-        # We'll use the first available voice or a default one
-        
-        # Use text-to-speech with a default voice (you can change this)
-        # Or get voices and use the first one
-        try:
+
+        if not voice_id:
+            print(f"   Falling back to default voice...")
             voices = client.voices.get_all()
             if voices.voices and len(voices.voices) > 0:
-                default_voice_id = voices.voices[0].voice_id
+                voice_id = voices.voices[0].voice_id
             else:
                 # Fallback to a known voice ID
-                default_voice_id = "JBFqnCBsd6RMkjVDRZzb"  # From the commented code
-            
-            print(f"   Using default voice ID: {default_voice_id}")
-            audio_generator = client.text_to_speech.convert(
-                voice_id=default_voice_id,
-                text=alert_message,
-                model_id="eleven_multilingual_v2",
-                output_format="mp3_44100_128"
-            )
-            
-            # Collect audio chunks
-            audio_data = b""
-            for chunk in audio_generator:
-                audio_data += chunk
-            
-            # Return audio as streaming response
-            return StreamingResponse(
-                iter([audio_data]),
-                media_type="audio/mpeg",
-                headers={
-                    "Content-Disposition": "inline; filename=alert.mp3",
-                    "Content-Length": str(len(audio_data))
-                }
-            )
-        except Exception as e:
-            print(f"   Error generating audio: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to generate audio: {str(e)}")
-            
+                voice_id = "JBFqnCBsd6RMkjVDRZzb"
+
+        print(f"   Using voice ID: {voice_id}")
+        ALERT_VOICE_ID = voice_id
+        return voice_id
+
+
+def synthesize_alert_speech(text):
+    """Runs Eleven Labs text-to-speech and returns the full MP3 bytes."""
+    client = get_elevenlabs_client()
+    voice_id = resolve_alert_voice_id(client)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        audio_generator = client.text_to_speech.convert(
+            voice_id=voice_id,
+            text=text,
+            model_id="eleven_multilingual_v2",
+            output_format="mp3_44100_128"
+        )
+        audio_data = b"".join(audio_generator)
+        outcome = "ok"
+        return audio_data
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, service="elevenlabs_tts", outcome=outcome)
+
+
+def mp3_response(audio_data, filename="alert.mp3"):
+    return StreamingResponse(
+        iter([audio_data]),
+        media_type="audio/mpeg",
+        headers={
+            "Content-Disposition": f"inline; filename={filename}",
+            "Content-Length": str(len(audio_data))
+        }
+    )
+
+
+@app.post("/generate_alert_audio")
+def generate_alert_audio(request: AlertAudioRequest):
+    """
+    Generate audio alert using Eleven Labs agent with danger nodes and escape path information.
+    Returns audio stream that can be played on frontend.
+    """
+    site = get_site(request.site_id)
+    try:
+        alert_message = build_alert_message(request.danger_nodes, request.escape_path, site.node_names)
+
+        LOG.sampled(
+            f"--- GENERATING ALERT AUDIO ---",
+            f"   Danger Nodes: {request.danger_nodes}",
+            f"   Escape Path: {request.escape_path}",
+            f"   Message: {alert_message[:100]}..."
+        )
+
+        return mp3_response(upstream_call(site.site_id, ALERT_TTS_TIMEOUT_SEC, synthesize_alert_speech, alert_message))
+
+    except (concurrent.futures.TimeoutError, Overloaded):
+        raise HTTPException(status_code=503, detail="Speech synthesis is saturated, retry shortly.",
+                            headers={"Retry-After": "5"})
     except Exception as e:
         print(f"   FATAL ERROR in generate_alert_audio: {e}")
         import traceback
@@ -603,81 +958,189 @@ async def generate_alert_audio(request: AlertAudioRequest):
         raise HTTPException(status_code=500, detail=f"Failed to generate alert audio: {str(e)}")
 
 
+# --- 7.6. Multi-Zone Alert Broadcast ---
+
+def wire_alert_broadcaster(site):
+    """Each site's broadcaster; its TTS calls queue on the shared UPSTREAM_POOL."""
+    def record_route_changes(zone_paths):
+        if site.incident_recorder:
+            try:
+                site.incident_recorder.record_routes(zone_paths)
+            except OSError as e:
+                LOG.log(f"--- BROADCAST [{site.site_id}]: Could not write incident log: {e} ---")
+
+    default_clip_dir = site.state_path + ".clips"
+    if site.site_id == DEFAULT_SITE_ID:
+        default_clip_dir = os.getenv("ALERT_CLIP_DIR", default_clip_dir)
+    site.alert_broadcaster = AlertBroadcaster(
+        zones=site.zones,
+        route_fn=site.route_for_zone,
+        message_fn=lambda danger_nodes, escape_path, shared_from: build_alert_segments(
+            danger_nodes, escape_path, site.node_names, shared_from),
+        synthesize_fn=lambda text: upstream_call(site.site_id, ALERT_TTS_TIMEOUT_SEC, synthesize_alert_speech, text),
+        max_concurrent=int(os.getenv("ALERT_TTS_CONCURRENCY", "4")),
+        rate_per_sec=float(os.getenv("ALERT_TTS_RATE_PER_SEC", "5")),
+        clip_dir=default_clip_dir,
+        on_routes=record_route_changes,
+    )
+
+
+for _site in SITES.values():
+    wire_alert_broadcaster(_site)
+
+
+@app.get("/alert_clips")
+def get_alert_clips(site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use")):
+    """Lists the published per-zone alert clips for the latest world state."""
+    return get_site(site_id).alert_broadcaster.get_published()
+
+
+@app.get("/alert_clips/{zone_id}")
+def get_alert_clip(zone_id: str, site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use")):
+    """Returns the ready-to-play alert clip for one zone."""
+    info, audio_data = get_site(site_id).alert_broadcaster.get_clip(zone_id)
+    if audio_data is None:
+        raise HTTPException(status_code=404, detail=f"No alert clip ready for zone '{zone_id}'.")
+    return mp3_response(audio_data, filename=f"alert_{zone_id}.mp3")
+
+
+# --- 7.7. Evacuation Simulation ---
+
+# Every simulated person is an agent, so the total is capped
+SIMULATE_MAX_PEOPLE = int(os.getenv("SIMULATE_MAX_PEOPLE", "100000"))
+SIMULATE_MAX_TIME = 4 * 3600
+
+
+class SimulationRequest(BaseModel):
+    # plan name -> {zone ID: [zone ID, ..., exit ID], or null for no path}
+    plans: Dict[str, Dict[str, Optional[List[str]]]]
+    # node ID -> people; default: current crowds + base_per_zone
+    population: Optional[Dict[str, conint(ge=0, le=SIMULATE_MAX_PEOPLE)]] = None
+    base_per_zone: conint(ge=0, le=SIMULATE_MAX_PEOPLE) = 20
+    max_time: confloat(gt=0, le=SIMULATE_MAX_TIME) = 1800
+    site_id: str = DEFAULT_SITE_ID
+
+
+def run_simulation(site, plans, population, max_time):
+    people = sum(population.values())
+    if people > SIMULATE_MAX_PEOPLE:
+        raise HTTPException(status_code=400,
+                            detail=f"Population of {people} exceeds the limit of {SIMULATE_MAX_PEOPLE} people.")
+    try:
+        ranked = site.evacuation_simulator.score_plans(plans, population, max_time=max_time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "best": ranked[0][0] if ranked else None,
+        "plans": [dict(result, name=name) for name, result in ranked],
+    }
+
+
+@app.get("/simulate")
+def simulate_current_state(
+    base_per_zone: int = Query(default=20, ge=0, description="People assumed in every zone on top of observed crowds"),
+    max_time: float = Query(default=1800, gt=0, le=SIMULATE_MAX_TIME),
+    site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use")
+):
+    """
+    Simulates the evacuation under the current world state for the
+    built-in routing strategies: the live crowd-aware routing, and
+    shortest distance ignoring crowds.
+    """
+    site = get_site(site_id)
+    snapshot = site.world_state.read()
+    danger_nodes = list(snapshot.danger_nodes)
+    crowd_data = [dict(c) for c in snapshot.crowd_data]
+    plans = {
+        "crowd_aware": site.plan_for_state(danger_nodes, site.routing_crowd(snapshot)),
+        "distance_only": site.plan_for_state(danger_nodes, []),
+    }
+    population = population_from_crowd(site.zones, crowd_data, base_per_zone)
+    return dict(run_simulation(site, plans, population, max_time), world_state_version=snapshot.version)
+
+
+@app.post("/simulate")
+def simulate_plans(request: SimulationRequest):
+    """Scores caller-supplied plans, e.g. to compare a new routing strategy."""
+    site = get_site(request.site_id)
+    population = request.population
+    if population is None:
+        crowd_data = [dict(c) for c in site.world_state.read().crowd_data]
+        population = population_from_crowd(site.zones, crowd_data, request.base_per_zone)
+    return run_simulation(site, request.plans, population, request.max_time)
+
+
+# --- 7.8. Sites ---
+
+@app.get("/sites")
+def get_sites():
+    """Every site this process serves, with its estimated memory, plus the shared upstream pool."""
+    sites = [site.describe() for site in SITES.values()]
+    return {
+        "sites": sites,
+        "total_memory_max_bytes": sum(site["memory"]["total_max_bytes"] for site in sites),
+        "upstream_pool": UPSTREAM_POOL.stats(),
+    }
+
+
 # --- 8. Voice Agent Integration ---
 
 class FireAlertVoiceAgent:
-    def __init__(self, session_id: str):
-        self.client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY", "sk_a630bc671f2500c1cf7a882d7d249a83d6b9bd424f93742f"))
+    def __init__(self, session_id: str, site):
+        self.site = site  # the caller's site: locations are resolved against its graph
+        self.client = get_elevenlabs_client()
         self.conversation = None
         self.location_detected = None
+        self.location_event = asyncio.Event()
         self.session_id = session_id
-        self.callback_queue = asyncio.Queue()
         
+    def publish(self, event_type, **fields):
+        VOICE_EVENTS.publish(self.session_id, {"type": event_type, "session_id": self.session_id,
+                                               "site_id": self.site.site_id, **fields})
+
     async def on_message(self, message):
         """Callback when agent receives a message"""
-        print(f"\n[Voice Agent] Role: {message.role}, Content: {message.content}")
+        LOG.log(f"[Voice Agent] Role: {message.role}, Content: {message.content}")
         
         # If user provided location, store it
-        if message.role == "user" and message.content:
-            # Try to extract node ID from user's response (e.g., "P1", "I'm at P5", etc.)
-            location = self._extract_node_id(message.content)
-            if location:
-                self.location_detected = location
-                print(f"\n✓ Location captured: {self.location_detected}")
-                
-                # Update global state
-                with VOICE_LOCK:
-                    VOICE_AGENT_STATE["location"] = location
-                    VOICE_AGENT_STATE["is_active"] = False
-                
-                await self.callback_queue.put({
-                    "type": "location",
-                    "location": location,
-                    "session_id": self.session_id
-                })
+        if message.role == "user" and message.content and not self.location_detected:
+            # Resolve the spoken place ("P5", "I'm at the Oval", "memorial church", ...)
+            match = self.site.location_resolver.resolve_best(message.content,
+                                                             min_confidence=LOCATION_MIN_CONFIDENCE)
+            if match and match["ambiguous"]:
+                # Several different places fit equally well: keep talking until the caller narrows it down
+                LOG.log(f"? Location ambiguous: {[match['node_id']] + match['alternatives']} ('{match['matched']}')")
+                self.publish("location_ambiguous", candidates=[match["node_id"]] + match["alternatives"],
+                             confidence=match["confidence"], matched=match["matched"])
+            elif match:
+                self.location_detected = match["node_id"]
+                LOG.log(f"✓ Location captured: {self.location_detected} "
+                      f"('{match['matched']}', confidence {match['confidence']})")
+                self.location_event.set()
+                self.publish("location", location=self.location_detected,
+                             confidence=match["confidence"], matched=match["matched"],
+                             alternatives=match["alternatives"])
         
-        # Send message to callback queue for streaming
-        await self.callback_queue.put({
-            "type": "message",
-            "role": message.role,
-            "content": message.content,
-            "session_id": self.session_id
-        })
-    
-    def _extract_node_id(self, text: str) -> Optional[str]:
-        """Extract node ID (P1, P2, etc.) from user's text response"""
-        import re
-        # Look for patterns like P1, P2, P10, etc.
-        match = re.search(r'\bP\d+\b', text.upper())
-        if match:
-            return match.group(0)
-        return None
+        # Publish message to every stream subscriber
+        self.publish("message", role=message.role, content=message.content)
     
     async def on_status_change(self, status):
         """Callback when connection status changes"""
-        print(f"[Voice Agent Status] {status}")
-        await self.callback_queue.put({
-            "type": "status",
-            "status": str(status),
-            "session_id": self.session_id
-        })
+        LOG.log(f"[Voice Agent Status] {status}")
+        self.publish("status", status=str(status))
     
     async def on_mode_change(self, mode):
         """Callback when conversation mode changes"""
-        print(f"[Voice Agent Mode] {mode.mode}")
+        LOG.log(f"[Voice Agent Mode] {mode.mode}")
     
     async def on_error(self, error):
         """Callback when error occurs"""
         print(f"[Voice Agent Error] {error}")
-        await self.callback_queue.put({
-            "type": "error",
-            "error": str(error),
-            "session_id": self.session_id
-        })
+        self.publish("error", error=str(error))
     
     async def run_fire_alert(self, agent_id: str):
         """Main conversation flow with ElevenLabs Conversational AI"""
-        print("\n=== FIRE ALERT VOICE AGENT ACTIVATED ===\n")
+        LOG.log("=== FIRE ALERT VOICE AGENT ACTIVATED ===")
         
         try:
             # Initialize conversation with callbacks
@@ -696,134 +1159,176 @@ class FireAlertVoiceAgent:
             self.conversation.on_mode_change = self.on_mode_change
             self.conversation.on_error = self.on_error
             
-            print("Starting conversation with fire alert agent...")
+            LOG.log("Starting conversation with fire alert agent...")
             
             # Start the conversation
             await self.conversation.start_session()
             
             # Keep conversation alive until location is detected or timeout (60 seconds)
-            timeout = 60
-            start_time = time.time()
-            
-            while time.time() - start_time < timeout:
-                if self.location_detected:
-                    print(f"Location detected: {self.location_detected}")
-                    break
-                await asyncio.sleep(0.5)
+            try:
+                await asyncio.wait_for(self.location_event.wait(), timeout=60)
+                LOG.log(f"Location detected: {self.location_detected}")
+            except asyncio.TimeoutError:
+                LOG.log(f"Voice session {self.session_id} timed out without a location.")
             
         except Exception as e:
             print(f"Error in voice agent: {e}")
-            await self.callback_queue.put({
-                "type": "error",
-                "error": str(e),
-                "session_id": self.session_id
-            })
+            self.publish("error", error=str(e))
         finally:
             if self.conversation:
                 await self.conversation.end_session()
+            self.publish("ended", location=self.location_detected)
             
         return self.location_detected
 
 
-# Store active voice agent sessions
-active_voice_sessions = {}
+def get_voice_session(session_id, site_id):
+    """The live session, or None if there is none (or it belongs to another site than site_id)."""
+    session = VOICE_SESSIONS.get(session_id)
+    if session is None or (site_id is not None and session.site_id != site_id):
+        return None
+    return session
 
 
 @app.get("/trigger_voice_alert")
-async def trigger_voice_alert():
+async def trigger_voice_alert(site_id: str = Query(default=DEFAULT_SITE_ID, description="The caller's site")):
     """Trigger the voice alert agent to ask for user's location"""
     import uuid
+    site = get_site(site_id)
     session_id = str(uuid.uuid4())
     
     # Get agent ID from environment or use default
     agent_id = os.getenv("ELEVENLABS_AGENT_ID", "agent_4701k9k3jegye7armnes8xvznfsb")
     
-    with VOICE_LOCK:
-        VOICE_AGENT_STATE["is_active"] = True
-        VOICE_AGENT_STATE["session_id"] = session_id
-        VOICE_AGENT_STATE["location"] = None
-    
-    # Create and store voice agent
-    agent = FireAlertVoiceAgent(session_id)
-    active_voice_sessions[session_id] = agent
-    
-    # Start voice agent in background task (use asyncio.create_task in async context)
-    task = asyncio.create_task(agent.run_fire_alert(agent_id))
-    # Don't await the task - let it run in background
+    # Create the voice agent and run it as a managed background task
+    agent = FireAlertVoiceAgent(session_id, site)
+    try:
+        VOICE_SESSIONS.start(session_id, agent, lambda a: a.run_fire_alert(agent_id), site_id=site_id)
+    except SessionLimitReached as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     
     return {
         "session_id": session_id,
+        "site_id": site_id,
         "status": "started",
         "message": "Voice alert agent activated. Please speak your location."
     }
 
 
-@app.get("/voice_alert_stream/{session_id}")
-async def voice_alert_stream(session_id: str):
-    """Stream voice agent events (SSE)"""
+def sse_stream(subscription, until_types=()):
+    """Relays bus events as SSE, with heartbeats, until a terminal event."""
     async def event_generator():
-        if session_id not in active_voice_sessions:
-            yield f"data: {json.dumps({'type': 'error', 'message': 'Session not found'})}\n\n"
-            return
-        
-        agent = active_voice_sessions[session_id]
-        
-        # Send initial connection message
-        yield f"data: {json.dumps({'type': 'connected', 'session_id': session_id})}\n\n"
-        
-        # Poll for messages from the agent's callback queue
-        timeout = 60  # 60 second timeout
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            try:
-                # Get message from queue (with timeout)
-                message = await asyncio.wait_for(agent.callback_queue.get(), timeout=1.0)
-                yield f"data: {json.dumps(message)}\n\n"
-                
-                # If location is detected, break
-                if message.get("type") == "location":
-                    # Clean up session after location is detected
-                    with VOICE_LOCK:
-                        VOICE_AGENT_STATE["location"] = message.get("location")
-                        VOICE_AGENT_STATE["is_active"] = False
+        try:
+            while True:
+                message = await subscription.get(timeout=15)
+                if message is None:
+                    if subscription.closed:
+                        break
+                    # Send heartbeat to keep connection alive
+                    yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+                    continue
+                yield f"id: {message['seq']}\ndata: {json.dumps(message)}\n\n"
+                if message.get("type") in until_types:
                     break
-                    
-            except asyncio.TimeoutError:
-                # Send heartbeat to keep connection alive
-                yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
-                continue
-            except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
-                break
-        
-        # Clean up session
-        if session_id in active_voice_sessions:
-            del active_voice_sessions[session_id]
-    
+        finally:
+            subscription.close()
+
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
+@app.get("/voice_alert_stream/{session_id}")
+async def voice_alert_stream(
+    session_id: str,
+    site_id: Optional[str] = Query(default=None, description="Only match a session of this site")
+):
+    """Stream one voice session's events (SSE). Late joiners get the last event of each type replayed."""
+    if site_id is not None:
+        get_site(site_id)
+    last_event = VOICE_EVENTS.last_event(session_id)
+    if site_id is not None and last_event is not None and last_event.get("site_id") != site_id:
+        last_event = None
+    if get_voice_session(session_id, site_id) is None and last_event is None:
+        async def not_found():
+            yield f"data: {json.dumps({'type': 'error', 'message': 'Session not found'})}\n\n"
+        return StreamingResponse(not_found(), media_type="text/event-stream")
+
+    subscription = VOICE_EVENTS.subscribe(session_id, maxsize=64)
+    return sse_stream(subscription, until_types=("ended",))
+
+
+@app.get("/voice_events")
+async def voice_events():
+    """Stream events from every voice session (SSE), for operator dashboards and logging."""
+    return sse_stream(VOICE_EVENTS.subscribe(ALL_TOPICS, maxsize=256))
+
+
+@app.get("/resolve_location")
+def resolve_location(
+    text: str = Query(..., description="Spoken or typed location, e.g. 'near Hoover Tower'"),
+    site_id: str = Query(default=DEFAULT_SITE_ID, description="Which site to use")
+):
+    """Returns the best-matching graph nodes for a location description."""
+    return {"text": text, "candidates": get_site(site_id).location_resolver.resolve(text, top_k=5)}
+
+
 @app.get("/get_voice_location/{session_id}")
-async def get_voice_location(session_id: str):
+async def get_voice_location(
+    session_id: str,
+    site_id: Optional[str] = Query(default=None, description="Only match a session of this site")
+):
     """Get the location from voice agent (polling endpoint)"""
-    with VOICE_LOCK:
-        if VOICE_AGENT_STATE["session_id"] == session_id:
-            location = VOICE_AGENT_STATE.get("location")
-            is_active = VOICE_AGENT_STATE.get("is_active", False)
-            
-            return {
-                "location": location,
-                "is_active": is_active,
-                "session_id": session_id
-            }
-        else:
-            return {
-                "location": None,
-                "is_active": False,
-                "session_id": session_id,
-                "error": "Session not found"
-            }
+    if site_id is not None:
+        get_site(site_id)
+    session = get_voice_session(session_id, site_id)
+    if session is None:
+        return {
+            "location": None,
+            "is_active": False,
+            "session_id": session_id,
+            "site_id": site_id,
+            "error": "Session not found"
+        }
+    return session.to_dict()
+
+# --- 9. Metrics ---
+
+def world_state_age():
+    """Age of the least recently confirmed site's world state."""
+    heartbeats = [site.world_state.heartbeat() for site in SITES.values()]
+    if not all(heartbeats):
+        return float("nan")
+    return time.time() - min(heartbeats)
+
+
+def location_cache_hit_ratio():
+    """Across every site's resolver."""
+    infos = [site.location_resolver.match_token.cache_info() for site in SITES.values()]
+    hits = sum(info.hits for info in infos)
+    total = hits + sum(info.misses for info in infos)
+    return hits / total if total else float("nan")
+
+
+Gauge("aegis_world_state_age_seconds", "Seconds since the scanner last confirmed the oldest site's world state.",
+      world_state_age)
+Gauge("aegis_location_token_cache_hit_ratio", "Hit ratio of every site's location resolver token cache.",
+      location_cache_hit_ratio)
+Gauge("aegis_voice_sessions_live", "Voice sessions currently held by the session manager.", lambda: len(VOICE_SESSIONS))
+Gauge("aegis_precomputed_scenarios", "Danger scenarios in every site's live precomputed route table.",
+      lambda: sum(site.scenario_routes.stats().get("scenarios", 0) for site in SITES.values()))
+Gauge("aegis_sites", "Sites served by this process.", lambda: len(SITES))
+Gauge("aegis_upstream_queued", "Decode/VLM/TTS tasks waiting for the shared upstream pool.",
+      lambda: sum(t["queued"] for t in UPSTREAM_POOL.stats()["tenants"].values()))
+Gauge("aegis_get_path_in_flight", "/get_path computations running.", lambda: PATH_GATE.running)
+Gauge("aegis_get_path_queued", "/get_path computations waiting for a slot.", lambda: PATH_GATE.waiting)
+Gauge("aegis_log_lines_suppressed", "Hot-path log lines dropped by sampling.", lambda: LOG.suppressed)
+
+
+@app.get("/metrics")
+def get_metrics(format: str = Query(default="prometheus", description="'prometheus' or 'json'")):
+    """Latency histograms, cache counters and gauges for the whole server."""
+    if format == "json":
+        return REGISTRY.snapshot()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 # --- 7. Run the Server ---
 
@@ -831,4 +1336,9 @@ if __name__ == "__main__":
     print("Starting FastAPI server and background scanner...")
     # --- PORT FIX ---
     # Running on a new, clean port
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    # API_WORKERS > 1 runs several worker processes; only one of them scans
+    workers = int(os.getenv("API_WORKERS", "1"))
+    if workers > 1:
+        uvicorn.run("main_app:app", host="0.0.0.0", port=8080, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
@@ -0,0 +1,217 @@
+import bisect
+import itertools
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# --- Metrics & Hot-Path Logging ---
+# A small Prometheus-compatible metrics layer (counters, histograms and
+# callback gauges) rendered at /metrics, plus a buffered, sampled logger
+# so request handlers never block on stdout.
+
+# Latency buckets in seconds: 100us .. 2min
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_str(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {",".join(k) or "total": v for k, v in self.values.items()}
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((k, list(v)) for k, v in self.series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {cumulative}")
+        return lines
+
+    def snapshot(self):
+        """Count, mean and bucket-estimated p50/p95/p99 for each label set."""
+        with self.lock:
+            items = [(k, list(v)) for k, v in self.series.items()]
+        result = {}
+        for key, series in items:
+            counts = series[:-1]
+            total = sum(counts)
+            summary = {"count": total, "mean": series[-1] / total if total else 0.0}
+            for q in (0.5, 0.95, 0.99):
+                rank, cumulative = q * total, 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    if cumulative >= rank:
+                        summary[f"p{int(q * 100)}"] = bound
+                        break
+            result[",".join(key) or "total"] = summary
+        return result
+
+
+class Gauge:
+    """A gauge whose value is computed by a callback at scrape time."""
+
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        REGISTRY.register(self)
+
+    def value(self):
+        try:
+            return self.fn()
+        except Exception:
+            return float("nan")
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.value()}"]
+
+    def snapshot(self):
+        value = self.value()
+        return None if value != value else value  # NaN is not valid JSON
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        return "\n".join(itertools.chain.from_iterable(m.render() for m in self.metrics)) + "\n"
+
+    def snapshot(self):
+        return {m.name: m.snapshot() for m in self.metrics}
+
+
+REGISTRY = Registry()
+
+# --- Metric Definitions ---
+
+GET_PATH_SECONDS = Histogram(
+    "aegis_get_path_seconds", "Latency of /get_path requests.", ["outcome"])
+SCANNER_STAGE_SECONDS = Histogram(
+    "aegis_scanner_stage_seconds", "Duration of each scanner stage per cycle.", ["stage"])
+UPSTREAM_SECONDS = Histogram(
+    "aegis_upstream_seconds", "Latency of calls to upstream model APIs.", ["service", "outcome"])
+SCAN_CAMERAS = Counter(
+    "aegis_scan_cameras_total", "Cameras per scan cycle by status (ok/late/failed).", ["status"])
+CACHE_REQUESTS = Counter(
+    "aegis_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+
+
+# --- Buffered, Sampled Logging ---
+
+class BufferedLog:
+    """
+    Collects log lines in memory and writes them from a background thread.
+    sampled() keeps only one in every `sample_every` lines, which is what
+    request handlers use; log() keeps every line.
+    """
+
+    def __init__(self, sample_every=20, flush_interval=1.0, max_buffer=10000):
+        self.sample_every = max(1, sample_every)
+        self.flush_interval = flush_interval
+        self.buffer = deque(maxlen=max_buffer)
+        self.sample_counter = itertools.count()
+        self.suppressed = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def log(self, message):
+        self.buffer.append(message)  # deque.append is thread-safe
+
+    def sampled(self, *messages):
+        """Buffers a group of lines for one in `sample_every` calls."""
+        if next(self.sample_counter) % self.sample_every == 0:
+            self.buffer.extend(messages)
+        else:
+            self.suppressed += 1
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True, name="buffered-log")
+                self.thread.start()
+
+    def flush(self):
+        lines = []
+        while self.buffer:
+            try:
+                lines.append(self.buffer.popleft())
+            except IndexError:
+                break
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
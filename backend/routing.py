@@ -0,0 +1,117 @@
+import networkx as nx
+
+# --- Routing Core ---
+# Shared by the /get_path endpoint and the alert broadcaster, so every
+# caller routes over the live world state in exactly the same way.
+
+
+def build_graph(node_list):
+    """Builds the weighted NetworkX graph from the graph.json node list."""
+    G = nx.Graph()
+    node_lookup = {}  # To quickly find node data by ID
+
+    # 1. Add all the nodes from the list
+    for node in node_list:
+        G.add_node(node["id"], name=node["name"], x=node["x"], y=node["y"], exit_node=node["exit_node"])
+        node_lookup[node["id"]] = node
+
+    # 2. Add all the edges using the "adjacent" key
+    for node in node_list:
+        u_id = node["id"]
+        u_node_data = node_lookup[u_id]
+
+        for v_id in node["adjacent"]:
+            if v_id in node_lookup:
+                v_node_data = node_lookup[v_id]
+                dx = u_node_data["x"] - v_node_data["x"]
+                dy = u_node_data["y"] - v_node_data["y"]
+                weight = (dx**2 + dy**2)**0.5  # sqrt(dx^2 + dy^2)
+                G.add_edge(u_id, v_id, weight=weight)
+            else:
+                print(f"Warning: Node {u_id} lists adjacent node {v_id} which does not exist.")
+
+    return G
+
+
+def crowd_signature(crowd_data):
+    """Hashable summary of crowd data, for caches keyed by world state."""
+    return tuple(sorted((str(c.get("node_id")), c.get("people_count", 0)) for c in crowd_data))
+
+
+def with_stale_penalties(crowd_data, stale_nodes, penalty):
+    """
+    crowd_data plus a fixed penalty on every stale node, so routes prefer
+    areas that were seen recently. The penalty is constant (not growing
+    with age) to keep crowd signatures, and the caches keyed by them, stable.
+    """
+    if not stale_nodes or not penalty:
+        return list(crowd_data)
+    return list(crowd_data) + [{"node_id": node, "people_count": penalty} for node in stale_nodes]
+
+
+def apply_world_state(G, danger_nodes, crowd_data):
+    """
+    Returns a copy of G with danger nodes removed and crowd penalties
+    added to every edge touching a crowded node. Unknown node IDs are
+    ignored. This runs per request, so it does not log.
+    """
+    G_copy = G.copy()
+
+    for node in danger_nodes:
+        if G_copy.has_node(node):
+            G_copy.remove_node(node)
+
+    for crowd_info in crowd_data:
+        node_id = crowd_info.get("node_id")
+        penalty = crowd_info.get("people_count", 0)
+
+        if G_copy.has_node(node_id):
+            for neighbor in list(G_copy.neighbors(node_id)):
+                edge = G_copy[node_id][neighbor]
+                edge['weight'] = edge.get('weight', 1) + penalty
+
+    return G_copy
+
+
+def find_safe_path(G, exit_nodes, start_node, danger_nodes, crowd_data):
+    """
+    Finds the lowest-cost path from start_node to the nearest reachable
+    exit. Returns (path, cost), or (None, inf) if the start is blocked or
+    no exit can be reached.
+    """
+    G_copy = apply_world_state(G, danger_nodes, crowd_data)
+
+    # --- A* Heuristic Function ---
+    def astar_heuristic(u, v):
+        try:
+            node_u = G.nodes[u]
+            node_v = G.nodes[v]
+            dx = node_u['x'] - node_v['x']
+            dy = node_u['y'] - node_v['y']
+            return (dx**2 + dy**2)**0.5  # Euclidean distance
+        except KeyError:
+            return 0
+
+    shortest_path = None
+    min_length = float('inf')
+
+    if not G_copy.has_node(start_node):
+        return None, min_length
+
+    for exit_node in exit_nodes:
+        if not G_copy.has_node(exit_node):
+            continue  # blocked or invalid
+
+        try:
+            path = nx.astar_path(G_copy, start_node, exit_node,
+                                 heuristic=astar_heuristic, weight='weight')
+            length = nx.path_weight(G_copy, path, weight='weight')
+
+            if length < min_length:
+                min_length = length
+                shortest_path = path
+
+        except nx.NetworkXNoPath:
+            continue
+
+    return shortest_path, min_length
@@ -0,0 +1,125 @@
+import time
+from concurrent.futures import wait
+
+# --- Deadline-Bounded Scan Cycles ---
+# One scan cycle fans out per camera (extract a frame, upload it) and then
+# makes one VLM call over whatever made it in time. The cycle has a hard
+# deadline and each camera a timeout, so a slow upload costs that camera
+# this cycle instead of stalling everyone:
+#   * "ok"     - analysed this cycle,
+#   * "late"   - missed its timeout or the cycle deadline,
+#   * "failed" - extraction/upload/VLM error.
+# Cameras that weren't analysed keep their previous danger and crowd
+# status, with the time it was last observed. Danger is only ever cleared
+# by a fresh observation, never by missing data. Nodes whose clear status
+# is older than `stale_after` are reported as stale, and routing
+# penalises them (routing.with_stale_penalties). Readers work staleness
+# out themselves from observed_at and the store's heartbeat (see
+# node_ages), so nodes still go stale if the scanner stops publishing.
+#
+# The scanner only publishes a new snapshot when something changed and
+# otherwise refreshes the heartbeat, so a node observed in the publishing
+# cycle has really been observed as of the heartbeat (last_observed).
+
+OK, LATE, FAILED = "ok", "late", "failed"
+
+
+def run_cameras(executor, jobs, fn, timeout, on_late=None):
+    """
+    Runs fn(job) for every job in parallel and waits at most `timeout`
+    seconds. Returns {job node ID: (status, result or error text)}.
+    on_late(job, result) is called for late jobs that do finish later, so
+    their side effects (uploaded files, temp frames) can be cleaned up.
+    Jobs the executor refuses to take count as failed.
+    """
+    futures, results = {}, {}
+    for job in jobs:
+        try:
+            futures[executor.submit(fn, job)] = job
+        except Exception as e:
+            results[job["node_id"]] = (FAILED, str(e))
+    done, _ = wait(futures, timeout=max(0.0, timeout))
+    for future, job in futures.items():
+        if future not in done:
+            results[job["node_id"]] = (LATE, None)
+            if future.cancel():
+                continue  # never started, nothing to clean up
+            if on_late is not None:
+                future.add_done_callback(
+                    lambda f, job=job: on_late(job, f.result()) if f.exception() is None else None)
+        elif future.exception() is not None:
+            results[job["node_id"]] = (FAILED, str(future.exception()))
+        else:
+            results[job["node_id"]] = (OK, future.result())
+    return results
+
+
+def last_observed(observed, updated_at, heartbeat):
+    """When a node was really last observed, given the snapshot it was read from."""
+    if heartbeat and observed == updated_at:
+        return max(observed, heartbeat)
+    return observed
+
+
+def merge_observations(previous, verdict, cameras, now, heartbeat=None):
+    """
+    The new world state from this cycle. previous is the last published
+    state dict, verdict the VLM's (danger_nodes, crowd_data) or None if
+    the VLM call failed, and cameras is {camera node ID: status}. Nodes
+    that weren't analysed carry over their previous danger and crowd
+    status and observation time; heartbeat is the store's heartbeat, which
+    brings forward the times of nodes re-observed since previous.
+    """
+    last_seen = previous.get("observed_at", {})
+    previous_danger = set(previous.get("danger_nodes", []))
+    previous_crowd = {c["node_id"]: c for c in previous.get("crowd_data", [])}
+    if verdict is None:
+        # Nothing was observed: carry the whole state over
+        carried = previous_danger | set(previous_crowd) | set(last_seen) | set(cameras)
+        danger_nodes, crowd_data = [], []
+    else:
+        carried = {node for node, status in cameras.items() if status != OK}
+        danger_nodes, crowd_data = verdict
+
+    danger = {n for n in danger_nodes if n not in carried} | (previous_danger & carried)
+    crowd = {c["node_id"]: c for c in crowd_data if c["node_id"] not in carried}
+    crowd.update({n: c for n, c in previous_crowd.items() if n in carried})
+
+    updated_at = previous.get("updated_at")
+    observed_at = {n: last_observed(t, updated_at, heartbeat) for n, t in last_seen.items() if n in carried}
+    for node in (set(cameras) | danger | set(crowd)) - carried:
+        observed_at[node] = now
+    # When each fire was first seen, for the spread model
+    first_seen = previous.get("danger_since", {})
+    return {
+        "danger_nodes": sorted(danger),
+        "crowd_data": [crowd[n] for n in sorted(crowd)],
+        "observed_at": observed_at,
+        "danger_since": {n: first_seen.get(n, now) for n in danger},
+        "cameras": dict(cameras),
+        "updated_at": now,
+    }
+
+
+def stale_nodes(state, now, stale_after):
+    """Nodes not in danger whose last observation is older than stale_after seconds."""
+    danger = set(state.get("danger_nodes", []))
+    return sorted(n for n, t in state.get("observed_at", {}).items()
+                  if n not in danger and now - t > stale_after)
+
+
+def node_ages(snapshot, heartbeat, now):
+    """Seconds since each node's status was last observed."""
+    return {node: round(max(0.0, now - last_observed(observed, snapshot.updated_at, heartbeat)), 3)
+            for node, observed in snapshot.observed_at.items()}
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.at
@@ -0,0 +1,191 @@
+import heapq
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS
+from routing import apply_world_state, crowd_signature
+
+# --- Precomputed Danger Scenarios ---
+# Live danger sets are small (a node or two plus its neighbours), so the
+# plausible scenarios can be solved ahead of time. For each scenario this
+# job runs one multi-source Dijkstra outward from every open exit, which
+# gives every node's cost to its nearest exit and the next hop towards
+# it. A path lookup is then just a walk along next hops.
+#
+# The scenarios are, in this order of priority under the table budget: no
+# danger, every single node, the configured higher-risk pairs, and (with
+# adjacent_pairs) every pair of neighbouring nodes. Each is stored as two
+# flat arrays over node indices (int32 next hop, float64 cost). Crowd
+# penalties change edge weights, so a table is only valid for the crowd
+# data it was built with. A new crowd state schedules a rebuild in the
+# background, and lookups miss (and fall back to live search) until it
+# is done.
+
+
+class ScenarioRoutes:
+    def __init__(self, G, exit_nodes, pairs=(), adjacent_pairs=False, max_table_bytes=64 << 20):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.pairs = [frozenset(p) for p in pairs if len(set(p)) == 2]
+        self.adjacent_pairs = adjacent_pairs
+        self.max_table_bytes = max_table_bytes
+        self.pending = None  # (graph, exit nodes, crowd_data) awaiting a build
+        self.worker = threading.Thread(target=self._run, daemon=True, name="scenario-routes")
+
+        # The table currently served; replaced as a whole by each build
+        self.table = None  # dict with nodes, index, exits, signature, scenarios
+        self.last_build_seconds = None
+        self.set_graph(G, exit_nodes)
+
+    def start(self):
+        self.worker.start()
+
+    def set_graph(self, G, exit_nodes):
+        """Invalidates all scenarios and rebuilds them for a new graph."""
+        with self.lock:
+            self.G = G
+            self.exit_nodes = list(exit_nodes)
+            self.table = None
+            self.pending = (G, self.exit_nodes, [])
+            self.wakeup.notify()
+
+    def submit(self, crowd_data):
+        """Schedules a rebuild for this crowd state unless it is already built or queued."""
+        signature = crowd_signature(crowd_data)
+        with self.lock:
+            if self.table is not None and self.table["signature"] == signature:
+                return
+            if self.pending is not None and crowd_signature(self.pending[2]) == signature:
+                return
+            self.pending = (self.G, self.exit_nodes, list(crowd_data))
+            self.wakeup.notify()
+
+    def lookup(self, start_node, danger_nodes, crowd_data):
+        """
+        (path, cost) from the precomputed table, with (None, inf) for an
+        unreachable exit, or None if this scenario isn't precomputed for
+        the given crowd state.
+        """
+        table = self.table  # one reference read; builds swap the whole dict
+        if table is None or table["signature"] != crowd_signature(crowd_data):
+            CACHE_REQUESTS.inc(cache="scenario_routes", result="miss")
+            return None
+        index = table["index"]
+        scenario = table["scenarios"].get(frozenset(n for n in danger_nodes if n in index))
+        start = index.get(start_node)
+        if scenario is None or start is None:
+            CACHE_REQUESTS.inc(cache="scenario_routes", result="miss")
+            return None
+        CACHE_REQUESTS.inc(cache="scenario_routes", result="hit")
+
+        next_hop, cost = scenario
+        if not np.isfinite(cost[start]):
+            return None, float("inf")
+        nodes, path, current = table["nodes"], [start_node], start
+        while next_hop[current] >= 0:
+            current = next_hop[current]
+            path.append(nodes[current])
+        return path, float(cost[start])
+
+    def stats(self):
+        table = self.table
+        with self.lock:
+            pending = self.pending is not None
+        if table is None:
+            return {"ready": False, "pending": pending}
+        return {
+            "ready": True,
+            "pending": pending,
+            "scenarios": len(table["scenarios"]),
+            "skipped_scenarios": table["skipped"],
+            "table_bytes": table["bytes"],
+            "build_seconds": self.last_build_seconds,
+            "crowd_entries": len(table["signature"]),
+        }
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.pending is None:
+                    self.wakeup.wait()
+                G, exit_nodes, crowd_data = self.pending
+                self.pending = None
+            try:
+                started = time.perf_counter()
+                table = self._build(G, exit_nodes, crowd_data)
+                with self.lock:
+                    if G is self.G:  # drop builds for a graph that was replaced meanwhile
+                        self.table = table
+                        self.last_build_seconds = time.perf_counter() - started
+                print(f"--- SCENARIOS: {len(table['scenarios'])} danger scenarios precomputed "
+                      f"in {time.perf_counter() - started:.2f}s ---")
+            except Exception as e:
+                print(f"--- SCENARIOS: ERROR precomputing routes: {e} ---")
+
+    def _build(self, G, exit_nodes, crowd_data):
+        weighted = apply_world_state(G, [], crowd_data)
+        nodes = list(weighted.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        adjacency = [[(index[v], data.get("weight", 1)) for v, data in weighted[u].items()] for u in nodes]
+        exits = [index[e] for e in exit_nodes if e in index]
+
+        scenarios_wanted = itertools.chain(
+            [frozenset()],
+            (frozenset([n]) for n in nodes),
+            (p for p in self.pairs if p <= index.keys()),
+            (frozenset(edge) for edge in (G.edges() if self.adjacent_pairs else ()) if len(set(edge)) == 2),
+        )
+        per_scenario = len(nodes) * (4 + 8)
+        budget = max(1, self.max_table_bytes // max(1, per_scenario))
+
+        scenarios, skipped = {}, 0
+        for scenario in scenarios_wanted:
+            if scenario in scenarios:
+                continue
+            if len(scenarios) >= budget:
+                skipped += 1
+                continue
+            blocked = {index[n] for n in scenario}
+            scenarios[scenario] = self._exit_tree(adjacency, exits, blocked)
+
+        return {
+            "nodes": nodes,
+            "index": index,
+            "signature": crowd_signature(crowd_data),
+            "scenarios": scenarios,
+            "skipped": skipped,
+            "bytes": len(scenarios) * per_scenario,
+        }
+
+    @staticmethod
+    def _exit_tree(adjacency, exits, blocked):
+        """Multi-source Dijkstra from every open exit: (next hop, cost) arrays."""
+        n = len(adjacency)
+        cost = np.full(n, np.inf)
+        next_hop = np.full(n, -1, dtype=np.int32)
+        dist = [float("inf")] * n
+        heap = []
+        for e in exits:
+            if e not in blocked:
+                dist[e] = 0.0
+                heap.append((0.0, e))
+        heapq.heapify(heap)
+        hop = [-1] * n
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for v, w in adjacency[u]:
+                if v in blocked:
+                    continue
+                nd = d + w
+                if nd < dist[v]:
+                    dist[v] = nd
+                    hop[v] = u  # v walks towards the exit via u
+                    heapq.heappush(heap, (nd, v))
+        cost[:] = dist
+        next_hop[:] = hop
+        return next_hop, cost
@@ -0,0 +1,238 @@
+import json
+import os
+import re
+import time
+
+from ch_router import CCHIndex, CCHRouter
+from evac_sim import EvacuationSimulator
+from incident_log import IncidentLogReader, IncidentRecorder
+from location_resolver import LocationResolver
+from routing import build_graph, find_safe_path, with_stale_penalties
+from scan_cycle import node_ages
+from scenario_routes import ScenarioRoutes
+from spread_model import SpreadModel, parse_wind, avoid_spread
+from world_store import WorldStateReader, WorldStateWriter
+
+# --- Multi-Site Serving ---
+# One process serves several sites (campuses). Each Site owns its graph,
+# camera registry, world-state store, incident log and routing structures
+# (CCH, precomputed scenarios, evacuation simulator), so one site's state
+# can never reach another site's routes. What sites share is the slow
+# upstream work: frame decode, uploads and VLM calls, and TTS all go
+# through one bounded FairExecutor (fair_pool.py).
+#
+# Sites are configured by one <site_id>.json per site in SITES_DIR:
+#   {"name": "North Campus", "graph": "north/graph.json",
+#    "cameras": {"P1": "north/videos/a.mp4"},
+#    "wind": {"speed": "10mph", "direction": "W"},
+#    "scenario_pairs": [["P1", "P2"]], "meters_per_unit": 1.5}
+# The wind feeds the site's smoke spread model (spread_model.py).
+# Relative paths are resolved against SITES_DIR. The "default" site is
+# built from the server's own graph.json and cameras unless SITES_DIR
+# defines one.
+#
+# A site's memory is dominated by fixed-size structures, so its cost is
+# predictable from the graph size and the configured budgets; see
+# memory_estimate().
+
+DEFAULT_SITE_ID = "default"
+SITE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Approximate CPython heap use per graph element, measured on synthetic
+# graphs of 2k-20k nodes (NetworkX dict-of-dicts plus the name index)
+GRAPH_NODE_BYTES = 500
+GRAPH_EDGE_BYTES = 160
+LOCATION_INDEX_NODE_BYTES = 1000
+
+
+def load_site_configs(config_dir):
+    """{site_id: config} for every <site_id>.json in config_dir (none if it doesn't exist)."""
+    configs = {}
+    if not config_dir or not os.path.isdir(config_dir):
+        return configs
+
+    def resolve(path):
+        return path if os.path.isabs(path) else os.path.join(config_dir, path)
+
+    for filename in sorted(os.listdir(config_dir)):
+        site_id, ext = os.path.splitext(filename)
+        if ext != ".json":
+            continue
+        if not SITE_ID.match(site_id):
+            raise ValueError(f"Invalid site ID '{site_id}': use letters, digits, '-' and '_'.")
+        with open(os.path.join(config_dir, filename)) as f:
+            raw = json.load(f)
+        if "graph" not in raw:
+            raise ValueError(f"Site '{site_id}' has no 'graph'.")
+        configs[site_id] = {
+            "name": raw.get("name", site_id),
+            "graph": resolve(raw["graph"]),
+            "cameras": {node: resolve(video) for node, video in raw.get("cameras", {}).items()},
+            "wind": raw.get("wind", {}),
+            "scenario_pairs": [tuple(pair) for pair in raw.get("scenario_pairs", [])],
+            "meters_per_unit": float(raw.get("meters_per_unit", 1.5)),
+        }
+    return configs
+
+
+class Site:
+    """Routing and world state for one site."""
+
+    def __init__(self, site_id, node_list, cameras, state_path, incident_log_path, cch_index_path,
+                 name=None, wind=None, scenario_pairs=(), precompute_adjacent_pairs=True,
+                 scenario_table_bytes=64 << 20, max_metrics=8, stale_penalty=50.0, stale_after=60.0,
+                 meters_per_unit=1.5,
+                 walk_speed=1.34, spread_margin=30.0, spread_options=None):
+        self.site_id = site_id
+        self.name = name or site_id
+        self.node_list = node_list
+        self.cameras = dict(cameras)  # node ID -> video source
+        self.wind = dict(wind or {})
+        self.stale_penalty = stale_penalty
+        self.stale_after = stale_after
+        self.meters_per_unit = meters_per_unit
+        self.walk_speed = walk_speed
+        self.spread_margin = spread_margin  # seconds to spare when passing a node before smoke reaches it
+
+        self.G = build_graph(node_list)
+        self.exit_nodes = [node["id"] for node in node_list if node.get("exit_node", False)]
+        # Every non-exit node is a zone that gets its own announcement
+        self.zones = [node["id"] for node in node_list if not node.get("exit_node", False)]
+        self.node_names = {node["id"]: node.get("name", node["id"]) for node in node_list}
+        self.location_resolver = LocationResolver(node_list)
+        print(f"Site '{site_id}': {self.G.number_of_nodes()} nodes, {self.G.number_of_edges()} edges, "
+              f"exits {self.exit_nodes}, cameras {sorted(self.cameras)}")
+
+        self.state_path = state_path
+        self.world_state = WorldStateReader(state_path)
+        self.world_state_writer = None  # Set in the scanner process only
+        self.incident_log_path = incident_log_path
+        self.incident_log = IncidentLogReader(incident_log_path)
+        self.incident_recorder = None  # Set in the scanner process only
+        self.alert_broadcaster = None  # Wired by the server, which owns TTS
+
+        try:
+            self.cch_router = CCHRouter(CCHIndex.load_or_build(cch_index_path, node_list), max_metrics=max_metrics)
+        except (ValueError, OSError) as e:
+            print(f"Warning: site '{site_id}' has no contraction hierarchy, using plain search: {e}")
+            self.cch_router = None
+
+        self.scenario_routes = ScenarioRoutes(self.G, self.exit_nodes, pairs=scenario_pairs,
+                                              adjacent_pairs=precompute_adjacent_pairs,
+                                              max_table_bytes=scenario_table_bytes)
+        self.evacuation_simulator = EvacuationSimulator(self.G, meters_per_unit=meters_per_unit, walk_speed=walk_speed)
+        self.spread_model = SpreadModel(node_list, meters_per_unit=meters_per_unit, **(spread_options or {}))
+        self.wind_vector = parse_wind(self.wind)
+        self.spread_cache = (None, None)  # (key, unsafe_at) for the latest danger state
+
+    def start_scanning(self):
+        """Makes this process the site's publisher."""
+        self.world_state_writer = WorldStateWriter(self.state_path)
+        self.incident_recorder = IncidentRecorder(self.incident_log_path)
+
+    def close(self):
+        if self.incident_recorder:
+            self.incident_recorder.close()
+
+    def stale_nodes(self, snapshot, now=None):
+        """
+        Nodes not in danger last observed more than stale_after seconds ago,
+        worked out now rather than taken from the snapshot, so they still go
+        stale if the scanner stops publishing.
+        """
+        now = time.time() if now is None else now
+        danger = set(snapshot.danger_nodes)
+        ages = node_ages(snapshot, self.world_state.heartbeat(), now)
+        return tuple(sorted(n for n, age in ages.items() if n not in danger and age > self.stale_after))
+
+    def routing_crowd(self, snapshot, stale_nodes=None):
+        """The crowd data every router should see for a snapshot, stale-node penalties included."""
+        if stale_nodes is None:
+            stale_nodes = self.stale_nodes(snapshot)
+        return with_stale_penalties(snapshot.crowd_data, stale_nodes, self.stale_penalty)
+
+    def live_search(self, start_node, danger_nodes, crowd_data):
+        """(path, cost, engine) for a danger set with no precomputed scenario."""
+        if self.cch_router is not None:
+            return self.cch_router.find_safe_path(start_node, danger_nodes, crowd_data) + ("ch",)
+        return find_safe_path(self.G, self.exit_nodes, start_node, danger_nodes, crowd_data) + ("search",)
+
+    def unsafe_at(self, danger_nodes, danger_since=None, now=None):
+        """
+        {node: seconds until smoke makes it unsafe} for fires at danger_nodes.
+        danger_since gives when each fire was first detected; fires without
+        one count as just detected. Cached for the current second.
+        """
+        now = time.time() if now is None else now
+        danger_since = danger_since or {}
+        key = (frozenset(danger_nodes), tuple(sorted((n, danger_since.get(n)) for n in danger_nodes)), int(now))
+        cached_key, unsafe_at = self.spread_cache
+        if cached_key == key:
+            return unsafe_at
+        burning_for = {n: now - t for n, t in danger_since.items()}
+        times = self.spread_model.unsafe_times(danger_nodes, self.wind_vector, burning_for)
+        unsafe_at = dict(zip(self.spread_model.nodes, times.tolist()))
+        self.spread_cache = (key, unsafe_at)
+        return unsafe_at
+
+    def avoid_spread(self, start_node, path, cost, danger_nodes, crowd_data, unsafe_at):
+        """spread_model.avoid_spread with this site's graph, walking speed and margin."""
+        return avoid_spread(self.G, self.exit_nodes, start_node, path, cost, danger_nodes, crowd_data, unsafe_at,
+                            self.meters_per_unit, self.walk_speed, self.spread_margin)
+
+    def route_for_zone(self, zone, danger_nodes, crowd_data):
+        if zone in danger_nodes:
+            return None
+        precomputed = self.scenario_routes.lookup(zone, danger_nodes, crowd_data)
+        if precomputed is not None:
+            path, cost = precomputed
+        else:
+            path, cost, _ = self.live_search(zone, danger_nodes, crowd_data)
+        if danger_nodes:
+            unsafe_at = self.unsafe_at(danger_nodes, self.world_state.read().danger_since)
+            path = self.avoid_spread(zone, path, cost, danger_nodes, crowd_data, unsafe_at)[0]
+        return path
+
+    def plan_for_state(self, danger_nodes, crowd_data):
+        """Every zone's escape path under the given state, as the broadcaster would route it."""
+        return {zone: self.route_for_zone(zone, danger_nodes, crowd_data) for zone in self.zones}
+
+    def memory_estimate(self):
+        """
+        Approximate bytes held by this site. The *_max entries are the
+        configured ceilings, so total_max_bytes is what the site can grow to.
+        """
+        nodes, edges = self.G.number_of_nodes(), self.G.number_of_edges()
+        graph = nodes * GRAPH_NODE_BYTES + edges * GRAPH_EDGE_BYTES
+        location_index = nodes * LOCATION_INDEX_NODE_BYTES
+        ch_index = ch_metrics_max = 0
+        if self.cch_router is not None:
+            ch_index = self.cch_router.index.memory_bytes()
+            ch_metrics_max = self.cch_router.max_metrics * self.cch_router.index.metric_bytes()
+        scenario_tables = self.scenario_routes.stats().get("table_bytes", 0)
+        # A rebuild holds the new table next to the one being served
+        scenario_tables_max = 2 * self.scenario_routes.max_table_bytes
+        simulator = len(self.evacuation_simulator.edges) * 2 * 8
+        return {
+            "graph_bytes": graph,
+            "location_index_bytes": location_index,
+            "ch_index_bytes": ch_index,
+            "ch_metrics_max_bytes": ch_metrics_max,
+            "scenario_tables_bytes": scenario_tables,
+            "scenario_tables_max_bytes": scenario_tables_max,
+            "simulator_bytes": simulator,
+            "total_max_bytes": graph + location_index + ch_index + ch_metrics_max + scenario_tables_max + simulator,
+        }
+
+    def describe(self):
+        return {
+            "site_id": self.site_id,
+            "name": self.name,
+            "nodes": self.G.number_of_nodes(),
+            "edges": self.G.number_of_edges(),
+            "exits": self.exit_nodes,
+            "cameras": sorted(self.cameras),
+            "scanning": self.world_state_writer is not None,
+            "world_state_version": self.world_state.read().version,
+            "memory": self.memory_estimate(),
+        }
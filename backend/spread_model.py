@@ -0,0 +1,229 @@
+import heapq
+import math
+import re
+
+import numpy as np
+
+# --- Local Smoke Spread Model ---
+# Estimates, for every node, how many seconds until smoke from the
+# detected fires makes it unsafe. Spread from each fire is an ellipse
+# stretched downwind: the front moves at
+#     spread_speed + wind_coupling * wind speed * cos(angle to the wind)
+# (never below upwind_speed), so a node's time is its straight-line
+# distance from the fire over that speed, minus how long the fire has
+# been burning. All fires and nodes are handled as one NumPy broadcast, so
+# an update takes well under a millisecond on campus-sized graphs.
+#
+# Time-aware routing then walks the person along a candidate path at
+# walk_speed and rejects paths that reach a node less than `margin`
+# seconds before it turns unsafe. If every path does, the one with the
+# most slack is the best effort.
+#
+# Map coordinates are image pixels: x grows east, y grows south.
+
+WIND_UNITS = {  # to meters per second
+    "m/s": 1.0, "mps": 1.0,
+    "mph": 0.44704,
+    "kph": 1 / 3.6, "km/h": 1 / 3.6, "kmh": 1 / 3.6,
+    "kt": 0.514444, "kts": 0.514444, "knots": 0.514444,
+}
+COMPASS = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+           "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
+SPEED_PATTERN = re.compile(r"^\s*([0-9.]+)\s*([a-z/]*)\s*$", re.IGNORECASE)
+
+
+def parse_wind(wind):
+    """
+    {"speed": "15mph", "direction": "NW"} -> (speed in m/s, unit (dx, dy)
+    the wind blows towards, in map coordinates). direction is where the
+    wind comes from, as a compass point or degrees; a bare speed is m/s.
+    """
+    speed = wind.get("speed", 0)
+    if isinstance(speed, str):
+        match = SPEED_PATTERN.match(speed)
+        if not match or match.group(2).lower() not in WIND_UNITS | {"": 1.0}:
+            raise ValueError(f"Unrecognised wind speed '{speed}'")
+        speed = float(match.group(1)) * WIND_UNITS.get(match.group(2).lower(), 1.0)
+
+    direction = wind.get("direction")
+    if direction is None or not speed:
+        return 0.0, (0.0, 0.0)
+    if isinstance(direction, str) and direction.upper() in COMPASS:
+        degrees = COMPASS.index(direction.upper()) * 22.5
+    else:
+        try:
+            degrees = float(direction)
+        except ValueError:
+            raise ValueError(f"Unrecognised wind direction '{direction}'") from None
+    # Blowing towards the opposite bearing; bearing 0 is north (-y)
+    towards = math.radians(degrees + 180)
+    return float(speed), (math.sin(towards), -math.cos(towards))
+
+
+class SpreadModel:
+    """Built once per graph; unsafe_times() is then cheap to call per world state."""
+
+    def __init__(self, node_list, meters_per_unit=1.0, spread_speed=0.5, wind_coupling=0.6, upwind_speed=0.05):
+        self.nodes = [node["id"] for node in node_list]
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.xy = np.array([[node["x"], node["y"]] for node in node_list], dtype=np.float64).reshape(-1, 2)
+        self.meters_per_unit = meters_per_unit
+        self.spread_speed = spread_speed
+        self.wind_coupling = wind_coupling
+        self.upwind_speed = upwind_speed
+
+    def unsafe_times(self, fire_nodes, wind=(0.0, (0.0, 0.0)), burning_for=None):
+        """
+        Seconds until each node is unsafe, as an array over self.nodes
+        (inf if there are no fires). wind is parse_wind()'s result;
+        burning_for is {fire node: seconds since it was first detected}.
+        """
+        fires = [self.index[n] for n in fire_nodes if n in self.index]
+        if not fires:
+            return np.full(len(self.nodes), np.inf)
+        speed, (wx, wy) = wind
+
+        offset = (self.xy[None, :, :] - self.xy[fires][:, None, :]) * self.meters_per_unit  # fires x nodes x 2
+        distance = np.hypot(offset[..., 0], offset[..., 1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cos_wind = np.where(distance > 0, (offset[..., 0] * wx + offset[..., 1] * wy) / distance, 0.0)
+        front_speed = np.maximum(self.spread_speed + self.wind_coupling * speed * cos_wind, self.upwind_speed)
+
+        burning = np.array([(burning_for or {}).get(self.nodes[f], 0.0) for f in fires])
+        times = np.maximum(distance / front_speed - burning[:, None], 0.0)
+        return times.min(axis=0)
+
+    def as_dict(self, times):
+        return {node: (None if not np.isfinite(t) else round(float(t), 1)) for node, t in zip(self.nodes, times)}
+
+
+def path_time_margin(G, path, unsafe_at, meters_per_unit, walk_speed=1.34):
+    """
+    Smallest slack, in seconds, between reaching a node on the path and
+    that node turning unsafe (inf if nothing on the path will). The start
+    node is skipped: the person is already there.
+    """
+    margin, elapsed = float("inf"), 0.0
+    for u, v in zip(path, path[1:]):
+        elapsed += G[u][v].get("weight", 1) * meters_per_unit / walk_speed
+        margin = min(margin, unsafe_at.get(v, float("inf")) - elapsed)
+    return margin
+
+
+def time_aware_search(G, exit_nodes, start_node, danger_nodes, crowd_data, unsafe_at,
+                      meters_per_unit, walk_speed=1.34, margin=30.0, max_labels=16):
+    """
+    Lowest-cost path to any exit that reaches every node at least `margin`
+    seconds before it turns unsafe. Cost is the same as find_safe_path
+    (length plus crowd penalties); arrival time comes from length alone.
+    Returns (path, cost), or (None, inf).
+
+    Cost and arrival time can disagree (a crowded shortcut is fast but
+    costly), so each node keeps every (cost, arrival) label no other label
+    beats on both, up to max_labels. The earliest-arriving label is always
+    kept, so a time-safe path is found whenever one exists.
+    """
+    blocked = set(danger_nodes)
+    if start_node not in G or start_node in blocked:
+        return None, float("inf")
+    penalty = {}
+    for crowd in crowd_data:
+        penalty[crowd.get("node_id")] = penalty.get(crowd.get("node_id"), 0) + crowd.get("people_count", 0)
+    exits = set(exit_nodes)
+    seconds_per_unit = meters_per_unit / walk_speed
+
+    labels = {start_node: [(0.0, 0.0)]}  # node -> non-dominated (cost, arrival)
+    parents = [(start_node, None)]  # label id -> (node, parent label id)
+    heap = [(0.0, 0.0, 0, start_node)]
+    while heap:
+        cost, elapsed, label_id, u = heapq.heappop(heap)
+        if (cost, elapsed) not in labels.get(u, ()):
+            continue  # dominated after it was queued
+        if u in exits:
+            path = []
+            while label_id is not None:
+                node, label_id = parents[label_id]
+                path.append(node)
+            return path[::-1], cost
+        for v, data in G[u].items():
+            if v in blocked:
+                continue
+            length = data.get("weight", 1)
+            arrival = elapsed + length * seconds_per_unit
+            if arrival + margin > unsafe_at.get(v, float("inf")):
+                continue  # would get there too late
+            new_cost = cost + length + penalty.get(u, 0) + penalty.get(v, 0)
+            existing = labels.get(v, [])
+            if any(c <= new_cost and a <= arrival for c, a in existing):
+                continue
+            kept = [(c, a) for c, a in existing if not (new_cost <= c and arrival <= a)]
+            if len(kept) >= max_labels:
+                if arrival >= min(a for _, a in kept):
+                    continue
+                kept.remove(max(kept))  # the new label arrives first, so the costliest can go
+            kept.append((new_cost, arrival))
+            labels[v] = kept
+            parents.append((v, label_id))
+            heapq.heappush(heap, (new_cost, arrival, len(parents) - 1, v))
+    return None, float("inf")
+
+
+def reaches_exit_in_time(G, exit_nodes, start_node, danger_nodes, unsafe_at, meters_per_unit,
+                         walk_speed=1.34, margin=30.0):
+    """Whether any exit can be reached passing every node `margin` seconds before it turns unsafe."""
+    blocked = set(danger_nodes)
+    if start_node not in G or start_node in blocked:
+        return False
+    exits = set(exit_nodes)
+    seconds_per_unit = meters_per_unit / walk_speed
+    best = {start_node: 0.0}
+    heap = [(0.0, start_node)]
+    while heap:
+        elapsed, u = heapq.heappop(heap)
+        if elapsed > best[u]:
+            continue
+        if u in exits:
+            return True
+        for v, data in G[u].items():
+            arrival = elapsed + data.get("weight", 1) * seconds_per_unit
+            if v in blocked or arrival + margin > unsafe_at.get(v, float("inf")):
+                continue
+            if arrival < best.get(v, float("inf")):
+                best[v] = arrival
+                heapq.heappush(heap, (arrival, v))
+    return False
+
+
+def avoid_spread(G, exit_nodes, start_node, path, cost, danger_nodes, crowd_data, unsafe_at,
+                 meters_per_unit, walk_speed=1.34, margin=30.0, precision=1.0):
+    """
+    Checks a route against the spread model: (path, cost, margin seconds,
+    rerouted). A route that reaches some node less than `margin` seconds
+    before it turns unsafe is replaced by the best time-safe one. If there
+    is none, the largest slack any route has is found (to `precision`
+    seconds, by bisection on the margin) and the cheapest route with it
+    is the best effort; the returned margin then stays below `margin`.
+    """
+    if not path:
+        return path, cost, None, False
+    slack = path_time_margin(G, path, unsafe_at, meters_per_unit, walk_speed)
+    if slack >= margin:
+        return path, cost, slack, False
+    safer, safer_cost = time_aware_search(G, exit_nodes, start_node, danger_nodes, crowd_data, unsafe_at,
+                                          meters_per_unit, walk_speed, margin)
+    if safer is None:
+        low, high = slack, margin  # some route has slack >= low; none has >= high
+        while high - low > precision:
+            mid = (low + high) / 2
+            if reaches_exit_in_time(G, exit_nodes, start_node, danger_nodes, unsafe_at, meters_per_unit,
+                                    walk_speed, mid):
+                low = mid
+            else:
+                high = mid
+        if low - slack <= precision:
+            return path, cost, slack, False
+        safer, safer_cost = time_aware_search(G, exit_nodes, start_node, danger_nodes, crowd_data, unsafe_at,
+                                              meters_per_unit, walk_speed, low)
+        if safer is None:
+            return path, cost, slack, False
+    return safer, safer_cost, path_time_margin(G, safer, unsafe_at, meters_per_unit, walk_speed), True
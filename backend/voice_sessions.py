@@ -0,0 +1,105 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# --- Voice Session Manager ---
+# Holds many concurrent FireAlertVoiceAgent sessions, each with its own
+# state. Live sessions are capped, and a reaper task expires sessions by
+# TTL and releases finished ones nobody has looked at for a while.
+# All methods are called from the event loop, so no locking is needed.
+
+
+class SessionLimitReached(Exception):
+    pass
+
+
+class VoiceSession:
+    def __init__(self, session_id, agent, site_id=None):
+        self.session_id = session_id
+        self.agent = agent
+        self.site_id = site_id
+        self.task = None
+        self.created_at = time.monotonic()
+        self.last_seen = self.created_at
+
+    @property
+    def is_active(self):
+        return self.task is not None and not self.task.done()
+
+    def to_dict(self):
+        return {
+            "location": self.agent.location_detected,
+            "is_active": self.is_active and self.agent.location_detected is None,
+            "session_id": self.session_id,
+            "site_id": self.site_id,
+        }
+
+
+class VoiceSessionManager:
+    def __init__(self, max_sessions=500, ttl_sec=300, idle_release_sec=60, on_release=None):
+        self.max_sessions = max_sessions
+        self.on_release = on_release
+        self.ttl_sec = ttl_sec
+        self.idle_release_sec = idle_release_sec
+        self.sessions = OrderedDict()  # session_id -> VoiceSession, oldest first
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def start(self, session_id, agent, coro_fn, site_id=None):
+        """Registers a session and runs coro_fn(agent) as its background task."""
+        if len(self.sessions) >= self.max_sessions:
+            self.reap()
+        if len(self.sessions) >= self.max_sessions:
+            self._evict_oldest_finished()
+        if len(self.sessions) >= self.max_sessions:
+            raise SessionLimitReached(f"{self.max_sessions} voice sessions are already live.")
+
+        session = VoiceSession(session_id, agent, site_id)
+        session.task = asyncio.create_task(coro_fn(agent))
+        self.sessions[session_id] = session
+        return session
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_seen = time.monotonic()
+        return session
+
+    def release(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return None
+        if session.is_active:
+            session.task.cancel()  # run_fire_alert ends the conversation in its finally
+            if self.on_release:
+                # The task still publishes from its finally, so only forget it once it's done
+                session.task.add_done_callback(lambda _: self.on_release(session_id))
+        elif self.on_release:
+            self.on_release(session_id)
+        return session
+
+    def reap(self):
+        """Drops sessions past their TTL and finished sessions left idle."""
+        now = time.monotonic()
+        expired = [
+            sid for sid, s in self.sessions.items()
+            if now - s.created_at > self.ttl_sec
+            or (not s.is_active and now - s.last_seen > self.idle_release_sec)
+        ]
+        for sid in expired:
+            self.release(sid)
+        return len(expired)
+
+    def _evict_oldest_finished(self):
+        for sid, s in self.sessions.items():
+            if not s.is_active:
+                self.release(sid)
+                return
+
+    async def run_reaper(self, interval_sec=5):
+        while True:
+            await asyncio.sleep(interval_sec)
+            released = self.reap()
+            if released:
+                print(f"[Voice Sessions] Released {released} expired session(s), {len(self.sessions)} live.")
@@ -0,0 +1,222 @@
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import deque, namedtuple
+from types import MappingProxyType
+
+# --- Shared World-State Store ---
+# The world state lives in a small memory-mapped file (on tmpfs when
+# available) so that one scanner process can publish it and any number of
+# API worker processes can read it without locks.
+#
+# Layout: header (magic, sequence, payload length, heartbeat) followed
+# by the JSON payload. The single writer uses a seqlock: it bumps the
+# sequence to an odd value, writes the payload, then bumps it to the next
+# even value. Readers retry if they see an odd sequence or if it changed
+# while they were copying. The version of a snapshot is sequence // 2.
+# Readers re-parse the payload only when the sequence has moved, and
+# hand out immutable WorldSnapshot objects that callers can keep.
+#
+# The scanner only publishes when the state actually changed, so the
+# version (and the ETag built from it) stays put in steady state. Each
+# successful scan still refreshes the header's heartbeat timestamp.
+#
+# Besides danger and crowds, a snapshot records when each node's status
+# was last observed, when each danger node was first detected, each
+# camera's status in the cycle that produced it, and the nodes whose
+# observation has gone stale (see scan_cycle.py).
+
+MAGIC = b"AEGISWS1"
+HEADER = struct.Struct("<8sQQd")  # magic, sequence, payload length, heartbeat
+FIELD = struct.Struct("<Q")
+HEARTBEAT = struct.Struct("<d")
+SEQUENCE_OFFSET, LENGTH_OFFSET, HEARTBEAT_OFFSET = 8, 16, 24
+DEFAULT_CAPACITY = 1 << 20  # 1 MiB of JSON is far beyond any realistic site
+
+# danger_nodes and stale_nodes are sorted tuples, crowd_data a tuple of
+# read-only mappings, observed_at, danger_since and cameras read-only mappings
+WorldSnapshot = namedtuple("WorldSnapshot", ["version", "danger_nodes", "crowd_data", "updated_at",
+                                             "observed_at", "danger_since", "cameras", "stale_nodes"])
+
+
+def default_store_path(name="aegis_world_state.bin"):
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, name)
+
+
+def make_snapshot(version, state):
+    return WorldSnapshot(
+        version=version,
+        danger_nodes=tuple(sorted(set(state.get("danger_nodes", [])))),
+        crowd_data=tuple(MappingProxyType(dict(c)) for c in state.get("crowd_data", [])),
+        updated_at=state.get("updated_at"),
+        observed_at=MappingProxyType(dict(state.get("observed_at", {}))),
+        danger_since=MappingProxyType(dict(state.get("danger_since", {}))),
+        cameras=MappingProxyType(dict(state.get("cameras", {}))),
+        stale_nodes=tuple(sorted(set(state.get("stale_nodes", [])))),
+    )
+
+
+EMPTY_SNAPSHOT = make_snapshot(0, {})
+
+
+def snapshot_to_dict(snapshot):
+    return {
+        "version": snapshot.version,
+        "danger_nodes": list(snapshot.danger_nodes),
+        "crowd_data": [dict(c) for c in snapshot.crowd_data],
+        "updated_at": snapshot.updated_at,
+        "observed_at": dict(snapshot.observed_at),
+        "danger_since": dict(snapshot.danger_since),
+        "cameras": dict(snapshot.cameras),
+        "stale_nodes": list(snapshot.stale_nodes),
+    }
+
+
+def diff_snapshots(old, new):
+    """What changed between two snapshots, for /world_state?since=."""
+    old_crowd = {c["node_id"]: c.get("people_count", 0) for c in old.crowd_data}
+    new_crowd = {c["node_id"]: c.get("people_count", 0) for c in new.crowd_data}
+    old_danger, new_danger = set(old.danger_nodes), set(new.danger_nodes)
+    return {
+        "version": new.version,
+        "since": old.version,
+        "full": False,
+        "danger_added": sorted(new_danger - old_danger),
+        "danger_removed": sorted(old_danger - new_danger),
+        "crowd_changed": {n: count for n, count in new_crowd.items() if old_crowd.get(n) != count},
+        "crowd_removed": sorted(set(old_crowd) - set(new_crowd)),
+        "updated_at": new.updated_at,
+        # Small enough to always send whole
+        "observed_at": dict(new.observed_at),
+        "danger_since": dict(new.danger_since),
+        "cameras": dict(new.cameras),
+        "stale_nodes": list(new.stale_nodes),
+    }
+
+
+class WorldStateWriter:
+    """The single publisher. Only the process that runs the scanner creates one."""
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = HEADER.size + capacity
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, sequence, _, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            sequence = 0
+            HEADER.pack_into(self.map, 0, MAGIC, 0, 0, 0.0)
+        # Continue after a scanner restart so versions stay monotonic
+        self.sequence = sequence + (sequence & 1)
+
+    def touch(self):
+        """Marks the current snapshot as re-confirmed by a successful scan."""
+        HEARTBEAT.pack_into(self.map, HEARTBEAT_OFFSET, time.time())
+
+    def publish(self, state):
+        """Writes a new snapshot and returns its version."""
+        payload = json.dumps(state, separators=(",", ":")).encode("utf-8")
+        if len(payload) > self.capacity:
+            raise ValueError(f"World state is {len(payload)} bytes; store capacity is {self.capacity}.")
+
+        self.sequence += 1  # odd: write in progress
+        FIELD.pack_into(self.map, SEQUENCE_OFFSET, self.sequence)
+        self.map[HEADER.size:HEADER.size + len(payload)] = payload
+        FIELD.pack_into(self.map, LENGTH_OFFSET, len(payload))
+        self.touch()
+        self.sequence += 1  # even: snapshot complete
+        FIELD.pack_into(self.map, SEQUENCE_OFFSET, self.sequence)
+        return self.sequence // 2
+
+
+class WorldStateReader:
+    """Lock-free reader; cheap enough to call on every request."""
+
+    def __init__(self, path, history_size=64):
+        self.path = path
+        self.map = None
+        self.next_open_attempt = 0.0
+        self.cached_sequence = None
+        self.cached = EMPTY_SNAPSHOT
+        # Recent snapshots seen by this process, for computing deltas
+        self.history = deque([EMPTY_SNAPSHOT], maxlen=history_size)
+
+    def _open(self):
+        now = time.monotonic()
+        if now < self.next_open_attempt:
+            return False
+        self.next_open_attempt = now + 1.0
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            if os.fstat(fd).st_size < HEADER.size:
+                return False
+            self.map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        return True
+
+    def read(self):
+        """Returns the current WorldSnapshot."""
+        if self.map is None and not self._open():
+            return self.cached
+
+        for _ in range(100):
+            magic, sequence, length, _ = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or sequence == 0:
+                return self.cached
+            if sequence == self.cached_sequence:
+                return self.cached
+            if sequence & 1:
+                time.sleep(0)  # writer mid-update; yield and retry
+                continue
+            payload = self.map[HEADER.size:HEADER.size + length]
+            if HEADER.unpack_from(self.map, 0)[1] != sequence:
+                continue  # torn read, retry
+            snapshot = make_snapshot(sequence // 2, json.loads(payload))
+            self.history.append(snapshot)
+            self.cached = snapshot  # single reference swap
+            self.cached_sequence = sequence
+            return snapshot
+        return self.cached
+
+    def heartbeat(self):
+        """time.time() of the last successful scan, or None if none yet."""
+        if self.map is None and not self._open():
+            return None
+        return HEARTBEAT.unpack_from(self.map, HEARTBEAT_OFFSET)[0] or None
+
+    def find_version(self, version):
+        for snapshot in reversed(self.history):
+            if snapshot.version == version:
+                return snapshot
+        return None
+
+
+def acquire_scanner_lock(path):
+    """
+    Tries to become the one scanner process. Returns an open file that
+    holds the lock for the life of the process, or None if another process
+    already holds it.
+    """
+    handle = open(path, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
@@ -17,7 +17,7 @@ const Dashboard = () => {
   const [evacuationPath, setEvacuationPath] = useState(null)
   const [voiceSessionId, setVoiceSessionId] = useState(null)
   const [voiceAgentActive, setVoiceAgentActive] = useState(false)
-  const pollingIntervalRef = useRef(null)
+  const eventSourceRef = useRef(null)
   const audioRef = useRef(null)
 
   // Generate and play alert audio using Eleven Labs
@@ -152,8 +152,8 @@ const Dashboard = () => {
       setVoiceSessionId(data.session_id)
       setVoiceAgentActive(true)
       
-      // Start polling for location
-      startLocationPolling(data.session_id)
+      // Listen for the location on the session's event stream
+      startLocationStream(data.session_id)
       
       // Update timeline
       setTimelineEvents(prev => [
@@ -167,59 +167,63 @@ const Dashboard = () => {
     }
   }
 
-  // Poll for location from voice agent
-  const startLocationPolling = (sessionId) => {
-    // Clear any existing polling
-    if (pollingIntervalRef.current) {
-      clearInterval(pollingIntervalRef.current)
+  // Stop listening to the voice agent event stream
+  const stopLocationStream = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close()
+      eventSourceRef.current = null
     }
+  }
+
+  // Subscribe to voice agent events (SSE)
+  const startLocationStream = (sessionId) => {
+    // Close any existing stream
+    stopLocationStream()
 
-    // Poll every 1 second for location
-    pollingIntervalRef.current = setInterval(async () => {
-      try {
-        const response = await fetch(`http://localhost:8080/get_voice_location/${sessionId}`)
-        if (!response.ok) {
-          throw new Error('Failed to get voice location')
-        }
-        const data = await response.json()
-        console.log('Voice agent status:', data)
+    const eventSource = new EventSource(`http://localhost:8080/voice_alert_stream/${sessionId}`)
+    eventSourceRef.current = eventSource
 
-        // If location is detected, fetch the path
-        if (data.location && !data.is_active) {
-          console.log('Location detected from voice agent:', data.location)
-          
-          // Stop polling
-          if (pollingIntervalRef.current) {
-            clearInterval(pollingIntervalRef.current)
-            pollingIntervalRef.current = null
-          }
-          
-          setVoiceAgentActive(false)
-          
-          // Fetch evacuation path with the detected location
-          const pathData = await fetchEvacuationPath(data.location)
-          
-          // Audio will be generated automatically in fetchEvacuationPath
-          
-          // Update timeline
-          setTimelineEvents(prev => [
-            ...prev,
-            { time: new Date().toLocaleTimeString('en-US', { hour12: false, hour: '2-digit', minute: '2-digit' }), 
-              event: `Location confirmed: ${data.location}`, 
-              active: true }
-          ])
-        }
-      } catch (error) {
-        console.error('Error polling voice location:', error)
+    eventSource.onmessage = async (event) => {
+      const data = JSON.parse(event.data)
+      if (data.type === 'heartbeat') {
+        return
       }
-    }, 1000) // Poll every 1 second
+      console.log('Voice agent event:', data)
+
+      // If location is detected, fetch the path
+      if (data.type === 'location' && data.location) {
+        console.log('Location detected from voice agent:', data.location)
+
+        stopLocationStream()
+        setVoiceAgentActive(false)
+
+        // Fetch evacuation path with the detected location
+        // (audio will be generated automatically in fetchEvacuationPath)
+        await fetchEvacuationPath(data.location)
+
+        // Update timeline
+        setTimelineEvents(prev => [
+          ...prev,
+          { time: new Date().toLocaleTimeString('en-US', { hour12: false, hour: '2-digit', minute: '2-digit' }), 
+            event: `Location confirmed: ${data.location}`, 
+            active: true }
+        ])
+      } else if (data.type === 'ended' || (data.type === 'error' && data.message === 'Session not found')) {
+        stopLocationStream()
+        setVoiceAgentActive(false)
+      }
+    }
+
+    eventSource.onerror = (error) => {
+      console.error('Voice agent event stream error:', error)
+    }
   }
 
-  // Cleanup polling and audio on unmount
+  // Cleanup event stream and audio on unmount
   useEffect(() => {
     return () => {
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current)
+      if (eventSourceRef.current) {
+        eventSourceRef.current.close()
       }
       if (audioRef.current) {
         audioRef.current.pause()
@@ -279,11 +283,8 @@ const Dashboard = () => {
     setVoiceSessionId(null)
     setVoiceAgentActive(false)
     
-    // Stop polling
-    if (pollingIntervalRef.current) {
-      clearInterval(pollingIntervalRef.current)
-      pollingIntervalRef.current = null
-    }
+    // Stop listening for voice agent events
+    stopLocationStream()
     
     setTimelineEvents([
       { time: '13:24', event: 'Normal monitoring', active: true }